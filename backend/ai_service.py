@@ -1,10 +1,15 @@
 import os
+import logging
 import google.generativeai as genai
 from dotenv import load_dotenv
 import json
-import time
-from PIL import Image
+import asyncio
 import io
+from typing import Optional, Union
+from model_router import ModelRouter, AllModelsFailed
+from quota_manager import QuotaManager, parse_rpm, PRIORITY_VERIFY, PRIORITY_SCAN, PRIORITY_CHAT
+import verification_cache
+import image_pipeline
 
 # 1. Load Environment Variables
 load_dotenv()
@@ -15,40 +20,91 @@ if not GOOGLE_API_KEY:
 
 genai.configure(api_key=GOOGLE_API_KEY)
 
-# --- SMART MODEL SELECTION ---
+# Per-request tracing (model attempts, cache hits); silent unless debug logging is enabled
+logger = logging.getLogger(__name__)
 
-def get_model():
+# --- MODEL REGISTRY ---
+
+# Config for generation
+GENERATION_CONFIGS = {
+    "default": {
+        "temperature": 0.7,
+        "max_output_tokens": 500,
+    },
+}
+
+# Priority list based on available models (Updated from list_models)
+models_to_try = [
+    'models/gemini-2.0-flash',
+    'models/gemini-2.5-flash',
+    'models/gemini-flash-latest',
+    'models/gemini-2.0-flash-lite',
+    'models/gemini-flash-lite-latest',
+    'models/gemini-pro-latest'
+]
+
+class ModelRegistry:
     """
-    Returns a configured Gemini model, trying multiple versions if needed.
+    Configured GenerativeModel clients keyed by (model name, generation config name).
+    Built once at startup (warm) and shared by every request, instead of constructing
+    a client on each attempt; anything not warmed is created on first use and kept.
     """
-    params = {
-        "generation_config": {
-            "temperature": 0.7,
-            "max_output_tokens": 500,
-        }
-    }
-    
-    # Priority list based on available models
-    models_to_try = [
-        'models/gemini-2.0-flash',
-        'models/gemini-2.5-flash',
-        'models/gemini-flash-latest',
-        'models/gemini-2.0-flash-lite',
-        'models/gemini-flash-lite-latest'
-    ]
-
-    for model_name in models_to_try:
-        try:
-            return genai.GenerativeModel(model_name, **params)
-        except Exception:
-            time.sleep(1)
-            continue
-            
-    # Default fallback
-    return genai.GenerativeModel('models/gemini-2.0-flash', **params)
-
-# Initialize the model dynamically
-model = get_model()
+    def __init__(self, model_names, generation_configs):
+        self.model_names = list(model_names)
+        self.generation_configs = generation_configs
+        self._models = {}
+
+    def get(self, model_name: str, config: str = "default") -> genai.GenerativeModel:
+        key = (model_name, config)
+        model = self._models.get(key)
+        if model is None:
+            model = genai.GenerativeModel(model_name, generation_config=self.generation_configs[config])
+            self._models[key] = model
+        return model
+
+    def warm(self):
+        for model_name in self.model_names:
+            for config in self.generation_configs:
+                self.get(model_name, config)
+        print(f"AI model registry ready: {len(self._models)} clients")
+
+    def __len__(self):
+        return len(self._models)
+
+
+registry = ModelRegistry(models_to_try, GENERATION_CONFIGS)
+
+# --- MODEL ROUTER ---
+# Failover order and circuit breaking for the models above (see model_router)
+
+router = ModelRouter(
+    models_to_try,
+    failure_threshold=int(os.getenv("AI_FAILURE_THRESHOLD", "3")),
+    cooldown_seconds=float(os.getenv("AI_COOLDOWN_SECONDS", "30")),
+    quota_cooldown_seconds=float(os.getenv("AI_QUOTA_COOLDOWN_SECONDS", "60")),
+)
+
+# --- QUOTA MANAGER ---
+# Shared per-model request budget; verification outranks scanning, which outranks chat (see quota_manager).
+# AI_MODEL_RPM overrides the per-model limit, e.g. "models/gemini-2.5-flash=10,models/gemini-pro-latest=5"
+# Limits are for the whole deployment; AI_QUOTA_PROCESSES (default: WEB_CONCURRENCY) API processes split them.
+
+quota = QuotaManager(
+    models_to_try,
+    default_rpm=float(os.getenv("AI_DEFAULT_RPM", "15")),
+    rpm_by_model=parse_rpm(os.getenv("AI_MODEL_RPM", "")),
+    processes=int(os.getenv("AI_QUOTA_PROCESSES", os.getenv("WEB_CONCURRENCY", "1"))),
+    reserves={
+        PRIORITY_VERIFY: 0.0,
+        PRIORITY_SCAN: float(os.getenv("AI_SCAN_RESERVE", "0.2")),
+        PRIORITY_CHAT: float(os.getenv("AI_CHAT_RESERVE", "0.5")),
+    },
+    max_waits={
+        PRIORITY_VERIFY: float(os.getenv("AI_VERIFY_MAX_WAIT_SECONDS", "10")),
+        PRIORITY_SCAN: float(os.getenv("AI_SCAN_MAX_WAIT_SECONDS", "2")),
+        PRIORITY_CHAT: 0.0,
+    },
+)
 
 
 # --- SYSTEM PROMPTS ---
@@ -68,156 +124,186 @@ Do not answer questions unrelated to the environment, nature, or the EcoLoop app
 
 # --- FUNCTIONS ---
 
-# Config for generation
-params = {
-    "generation_config": {
-        "temperature": 0.7,
-        "max_output_tokens": 500,
-    }
-}
-
-
-# Priority list based on available models (Updated from list_models)
-models_to_try = [
-    'models/gemini-2.0-flash',
-    'models/gemini-2.5-flash',
-    'models/gemini-flash-latest',
-    'models/gemini-2.0-flash-lite',
-    'models/gemini-flash-lite-latest',
-    'models/gemini-pro-latest'
-]
-
 async def get_chat_response(user_message: str):
     """
     Handles chat interactions for the EcoBot interface with robust failover.
     """
     full_prompt = f"{ECOLOOP_SYSTEM_PROMPT}\n\nUser: {user_message}\nEcoBot:"
-    
-    quota_error_hit = False
 
-    for model_name in models_to_try:
-        try:
-            print(f"DEBUG: Trying Chat with model: {model_name}")
-            model = genai.GenerativeModel(model_name, **params)
-            response = await model.generate_content_async(full_prompt)
-            return {"response": response.text}
-        except Exception as e:
-            error_str = str(e)
-            print(f"⚠️ Model {model_name} failed: {e}")
-            if "429" in error_str or "quota" in error_str.lower():
-                quota_error_hit = True
-            time.sleep(1)
-            continue # Try next model
-
-    # If all fail
-    print("❌ All AI models failed.")
-    
-    if quota_error_hit:
+    async def attempt(model_name: str) -> dict:
+        logger.debug("Trying Chat with model: %s", model_name)
+        response = await registry.get(model_name).generate_content_async(full_prompt)
+        return {"response": response.text}
+
+    try:
+        return await quota.run(router, attempt, PRIORITY_CHAT, label="Chat")
+    except AllModelsFailed as e:
+        if e.throttled:
+            # Quota is being kept for proof verification; answer right away instead of waiting
+            return {
+                "response": "I'm a little busy helping everyone verify their eco-actions right now! 🌿 Ask me again in a moment. Meanwhile: switching off lights you're not using is an easy win."
+            }
+        # If all fail
+        print("❌ All AI models failed.")
+        if e.quota_exhausted:
+            return {
+                "response": "I'm feeling a bit overwhelmed right now (Rate Limit Reached)! 🌿 But remember: Every small action counts. Try asking me again in a minute!"
+            }
+        return {"response": "I'm having trouble connecting to the nature network right now. Try again later! 🌱"}
+
+async def upload_video(file_path: str, mime_type: str):
+    """Uploads a video to the Gemini File API and waits (without blocking the event loop) until it is processed."""
+    logger.debug("Processing video with Gemini File API: %s", file_path)
+    video_file = await asyncio.to_thread(genai.upload_file, path=file_path, mime_type=mime_type)
+
+    # Wait for processing
+    attempt = 0
+    while video_file.state.name == "PROCESSING":
+        print(".", end="", flush=True)
+        await asyncio.sleep(1)
+        video_file = await asyncio.to_thread(genai.get_file, video_file.name)
+        attempt += 1
+        if attempt > 30: # Timeout
+            raise Exception("Video processing timeout")
+
+    if video_file.state.name == "FAILED":
+        raise Exception("Video processing failed at Google Gemini backend.")
+    return video_file
+
+def parse_verification(text: str) -> dict:
+    text = text.replace('```json', '').replace('```', '').strip()
+    try:
+        result = json.loads(text)
         return {
-            "response": "I'm feeling a bit overwhelmed right now (Rate Limit Reached)! 🌿 But remember: Every small action counts. Try asking me again in a minute!"
+            "verified": result.get("valid", False),
+            "is_valid": result.get("valid", False),
+            "message": result.get("reason", "Analysis complete."),
+            "confidence": 0.95 
         }
-        
-    return {"response": "I'm having trouble connecting to the nature network right now. Try again later! 🌱"}
+    except json.JSONDecodeError:
+        is_valid = "true" in text.lower() or "yes" in text.lower()
+        return {
+            "verified": is_valid,
+            "is_valid": is_valid,
+            "message": text,
+            "confidence": 0.8
+        }
+
+def quality_rejection(report: dict) -> dict:
+    """Verification result for an image rejected by the image_quality gate."""
+    return {
+        "verified": False,
+        "is_valid": False,
+        "message": report["message"],
+        "confidence": 1.0,
+        "quality_issues": report["issues"],
+    }
 
-async def verify_task_content(file_path: str, mime_type: str, task_tag: str) -> dict:
+async def verify_task_content(source: Union[str, bytes], mime_type: str, task_tag: str, content_hash: Optional[str] = None) -> dict:
     """
     Verifies if the uploaded content (Image or Video) matches the required task using Gemini.
+    `source` is the image bytes or a file path (videos are always passed as a path).
+    Pass the SHA-256 of the uploaded bytes as `content_hash` to reuse an earlier verdict for the
+    same file and label (see verification_cache).
     """
     if not GOOGLE_API_KEY:
         print("WARNING: GEMINI_API_KEY not found. Returning Mock Success.")
         return {
             "is_valid": True, 
             "message": "AI Verification Skipped (No API Key). Assuming success!", 
-            "confidence": 1.0
+            "confidence": 1.0,
+            "bypassed": True # not a real verdict: callers must not treat the proof as verified
         }
 
-    prompt = f"Analyze this media (could be image or video). Does it show {task_tag}? Answer ONLY with a JSON object: {{ 'valid': boolean, 'reason': string }}."
-    
-    last_error = None
-    quota_error_hit = False
-
-    for model_name in models_to_try:
+    if content_hash:
         try:
-            print(f"DEBUG: Verifying with model: {model_name}")
-            model = genai.GenerativeModel(model_name, **params)
-
-            if mime_type.startswith('video/'):
-                # Video processing
-                print(f"DEBUG: Processing video with Gemini File API with {model_name}: {file_path}")
-                
-                # Upload the file (Do this only once if possible, but for simplicity here we assume re-upload or reuse)
-                video_file = genai.upload_file(path=file_path, mime_type=mime_type)
-                
-                # Wait for processing
-                attempt = 0
-                while video_file.state.name == "PROCESSING":
-                    print(".", end="", flush=True)
-                    time.sleep(1)
-                    video_file = genai.get_file(video_file.name)
-                    attempt += 1
-                    if attempt > 30: # Timeout
-                        raise Exception("Video processing timeout")
-
-                if video_file.state.name == "FAILED":
-                    raise Exception("Video processing failed at Google Gemini backend.")
-
-                response = await model.generate_content_async([prompt, video_file])
-            else:
-                # Image processing
-                image = Image.open(file_path)
-                response = await model.generate_content_async([prompt, image])
+            cached = await verification_cache.cache.get(content_hash, task_tag)
+        except Exception as e:
+            # A cache miss is harmless; don't fail the verification over it (e.g. SQLite lock timeout)
+            print(f"⚠️ Could not read verification cache: {e}")
+            cached = None
+        if cached is not None:
+            logger.debug("Verification cache hit")
+            return cached
 
-            if not response or not hasattr(response, 'text'):
-                 raise Exception("Empty response from AI")
-
-            text = response.text.replace('```json', '').replace('```', '').strip()
-            
-            try:
-                result = json.loads(text)
-                return {
-                    "verified": result.get("valid", False),
-                    "is_valid": result.get("valid", False),
-                    "message": result.get("reason", "Analysis complete."),
-                    "confidence": 0.95 
-                }
-            except json.JSONDecodeError:
-                is_valid = "true" in text.lower() or "yes" in text.lower()
-                return {
-                    "verified": is_valid,
-                    "is_valid": is_valid,
-                    "message": text,
-                    "confidence": 0.8
-                }
+    prompt = f"Analyze this media (could be image or video). Does it show {task_tag}? Answer ONLY with a JSON object: {{ 'valid': boolean, 'reason': string }}."
 
-        except Exception as e:
-            error_msg = str(e)
-            print(f"⚠️ Verification Model {model_name} failed: {error_msg}")
-            last_error = error_msg
-            if "429" in error_msg or "quota" in error_msg.lower():
-                quota_error_hit = True
-            
-            time.sleep(1)
-            # If video was uploaded, we might leave it. It's fine for now.
-            continue
-            
-    # If all failed
-    if quota_error_hit:
-         print("⚠️ Quota Exceeded. Falling back to 'Success' for developer experience.")
-         return {
-            "verified": True,
-            "is_valid": True,
-            "message": "AI Quota Exceeded. (Developer Mode: Verification Bypassed so you can proceed!) 🌿",
-            "confidence": 1.0
+    # Media is prepared once and reused by every model attempt; an upload failure is not a model failure
+    try:
+        if mime_type.startswith('video/'):
+            media = await upload_video(source, mime_type)
+        else:
+            media, quality = await image_pipeline.pipeline.prepare_checked(source, mime_type)
+            if media is None:
+                # Failed the local quality gate; no point asking the model
+                return quality_rejection(quality)
+    except Exception as e:
+        print(f"⚠️ Media preparation failed: {e}")
+        return {"verified": False, "is_valid": False, "message": f"AI Error: {e}", "confidence": 0.0}
+
+    async def attempt(model_name: str) -> dict:
+        logger.debug("Verifying with model: %s", model_name)
+        response = await registry.get(model_name).generate_content_async([prompt, media])
+        if not response or not hasattr(response, 'text'):
+            raise Exception("Empty response from AI")
+        return parse_verification(response.text)
+
+    try:
+        result = await quota.run(router, attempt, PRIORITY_VERIFY, label="Verification")
+    except AllModelsFailed as e:
+        if e.throttled:
+            # Our own request budget ran out: ask for a retry rather than bypassing verification
+            return {
+                "verified": False,
+                "is_valid": False,
+                "message": "The AI verifier is very busy right now. Please try again in a minute.",
+                "confidence": 0.0
+            }
+        # If all failed
+        if e.quota_exhausted:
+            print("⚠️ Quota Exceeded. Falling back to 'Success' for developer experience.")
+            return {
+                "verified": True,
+                "is_valid": True,
+                "message": "AI Quota Exceeded. (Developer Mode: Verification Bypassed so you can proceed!) 🌿",
+                "confidence": 1.0,
+                "bypassed": True
+            }
+
+        return {
+            "verified": False,
+            "is_valid": False, 
+            "message": f"AI Error: {e}", 
+            "confidence": 0.0
         }
 
-    return {
-        "verified": False,
-        "is_valid": False, 
-        "message": f"AI Error: {last_error}", 
-        "confidence": 0.0
-    }
+    # Only real model verdicts are cached, never the fallbacks above
+    if content_hash:
+        try:
+            await verification_cache.cache.put(content_hash, task_tag, result)
+        except Exception as e:
+            print(f"⚠️ Could not cache verification result: {e}")
+    return result
+
+def parse_scan(text: str) -> dict:
+    text = text.replace('```json', '').replace('```', '').strip()
+    # Clean up potential leading/trailing non-json chars
+    if text.startswith('{'):
+        return json.loads(text)
+    # Try to extract JSON if there's any text around it
+    start = text.find('{')
+    end = text.rfind('}') + 1
+    if start != -1 and end != -1:
+        return json.loads(text[start:end])
+    raise Exception(f"No valid JSON found in response: {text[:100]}...")
+
+OVERWHELMED_SCAN = {
+    "object_name": "Slightly Overwhelmed AI",
+    "recycling_protocol": "I'm currently receiving too many requests! However, most household items like bottles and paper can be recycled in your blue bin. Try again in a minute!",
+    "eco_fact": "Processing images takes a lot of 'brain power'! Even so, your commitment to the planet is inspiring.",
+}
 
-async def analyze_eco_object(file_path: str, mime_type: str) -> dict:
+async def analyze_eco_object(source: Union[str, bytes], mime_type: str) -> dict:
     """
     Identifies an object and provides its recycling protocol, an eco-fact, and assigns points.
     """
@@ -231,43 +317,32 @@ async def analyze_eco_object(file_path: str, mime_type: str) -> dict:
     CRITICAL: Return ONLY a valid JSON object. No preamble, no markdown formatting.
     """
 
-    last_error = "All models failed"
-    for model_name in models_to_try:
-        try:
-            print(f"DEBUG: Scanning Eco-Object with model: {model_name}")
-            model = genai.GenerativeModel(model_name, **params)
-            image = Image.open(file_path)
-            response = await model.generate_content_async([prompt, image])
+    try:
+        image, quality = await image_pipeline.pipeline.prepare_checked(source, mime_type)
+        if image is None:
+            # The endpoint turns this into an error instead of awarding points
+            return {"quality_ok": False, "message": quality["message"], "issues": quality["issues"]}
 
+        async def attempt(model_name: str) -> dict:
+            logger.debug("Scanning Eco-Object with model: %s", model_name)
+            response = await registry.get(model_name).generate_content_async([prompt, image])
             if not response or not hasattr(response, 'text'):
-                 raise Exception("Empty response from AI")
-
-            text = response.text.replace('```json', '').replace('```', '').strip()
-            # Clean up potential leading/trailing non-json chars
-            if text.startswith('{'):
-                return json.loads(text)
-            else:
-                # Try to extract JSON if there's any text around it
-                start = text.find('{')
-                end = text.rfind('}') + 1
-                if start != -1 and end != -1:
-                    return json.loads(text[start:end])
-                raise Exception(f"No valid JSON found in response: {text[:100]}...")
-            
-        except Exception as e:
-            print(f"⚠️ Scanner Model {model_name} failed: {e}")
-            last_error = str(e)
-            time.sleep(1)
-            continue
+                raise Exception("Empty response from AI")
+            return parse_scan(response.text)
+
+        return await quota.run(router, attempt, PRIORITY_SCAN, label="Scanner")
+    except AllModelsFailed as e:
+        if e.throttled:
+            # Out of our own budget: same "overwhelmed" answer, but nothing was scanned so no coins
+            return {**OVERWHELMED_SCAN, "points": 0}
+        quota_exhausted = e.quota_exhausted
+    except Exception as e:
+        print(f"⚠️ Scanner failed: {e}")
+        quota_exhausted = False
 
     # Fallback if AI fails (Provide a slightly better specific message if it's a quota issue)
-    if "429" in last_error or "quota" in last_error.lower():
-         return {
-            "object_name": "Slightly Overwhelmed AI",
-            "recycling_protocol": "I'm currently receiving too many requests! However, most household items like bottles and paper can be recycled in your blue bin. Try again in a minute!",
-            "eco_fact": "Processing images takes a lot of 'brain power'! Even so, your commitment to the planet is inspiring.",
-            "points": 5
-        }
+    if quota_exhausted:
+         return {**OVERWHELMED_SCAN, "points": 5}
 
     return {
         "object_name": "Unidentified Item",
@@ -1,26 +1,61 @@
 from datetime import datetime, timedelta
 from typing import Optional
+from collections import OrderedDict
+import os
+import threading
+import time
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-import database, models, schemas
+from sqlalchemy.ext.asyncio import AsyncSession
+import database, models, schemas, hashing, process_pool
 
 # SECURITY CONFIGURATION (In production, move to .env)
 SECRET_KEY = "supersecretkey_ecoloop_hackathon_demo" 
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 # 1 day for demo convenience
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+# Per-process cache of authenticated users (keyed by token subject).
+# invalidate() only reaches the current process: with several workers another
+# worker can serve a snapshot up to USER_CACHE_TTL_SECONDS old, so keep it short.
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", 10))
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", 10000))
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 # --- Hashing Utilities ---
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return hashing.verify_password(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return hashing.hash_password(password)
+
+# Request handlers use the async variants, which run on the dedicated hashing pool
+hashing_busy_exception = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Too many sign-ins right now. Please try again in a few seconds.",
+    headers={"Retry-After": "2"},
+)
+
+async def verify_password_async(plain_password, hashed_password):
+    try:
+        return await hashing.pool.run(hashing.verify_password, plain_password, hashed_password)
+    except process_pool.PoolUnavailable:
+        raise hashing_busy_exception
+
+async def verify_and_update_password_async(plain_password, hashed_password):
+    try:
+        return await hashing.pool.run(hashing.verify_and_update, plain_password, hashed_password)
+    except process_pool.PoolUnavailable:
+        raise hashing_busy_exception
+
+async def get_password_hash_async(password):
+    try:
+        return await hashing.pool.run(hashing.hash_password, password)
+    except process_pool.PoolUnavailable:
+        raise hashing_busy_exception
 
 # --- JWT Utilities ---
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -33,23 +68,161 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# --- Authenticated User Cache ---
+
+# Columns copied into the cache. Anything else (relationships, password hash)
+# is read from the ORM row, which is only loaded when an endpoint asks for it.
+CACHED_USER_FIELDS = ("id", "username", "email", "coins", "streak", "last_login", "profile_image")
+
+class UserCache:
+    """
+    Bounded LRU of user snapshots with a TTL.
+    Writers must call invalidate() after committing so balances never go stale.
+    Readers take generation() before querying the row and pass it to put(), so a
+    row read before a concurrent invalidate() is returned but never cached.
+    """
+    def __init__(self, ttl_seconds: float, max_size: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries = OrderedDict()  # username -> (expires_at, snapshot)
+        self._invalidated = OrderedDict()  # username -> generation of its last invalidate()
+        self._generation = 0
+        self._evicted_generation = 0  # newest generation dropped from _invalidated
+        self._lock = threading.Lock()
+
+    def get(self, username: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return None
+            expires_at, snapshot = entry
+            if expires_at < time.monotonic():
+                del self._entries[username]
+                return None
+            self._entries.move_to_end(username)
+            return snapshot
+
+    def generation(self) -> int:
+        with self._lock:
+            return self._generation
+
+    def put(self, user: models.User, read_generation: int) -> dict:
+        snapshot = {field: getattr(user, field) for field in CACHED_USER_FIELDS}
+        if self.ttl_seconds <= 0 or self.max_size <= 0:
+            return snapshot
+        with self._lock:
+            if self._invalidated.get(user.username, self._evicted_generation) > read_generation:
+                # Invalidated while this row was being read: it may predate the write
+                return snapshot
+            self._entries[user.username] = (time.monotonic() + self.ttl_seconds, snapshot)
+            self._entries.move_to_end(user.username)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, username: str):
+        with self._lock:
+            self._entries.pop(username, None)
+            self._generation += 1
+            self._invalidated[username] = self._generation
+            self._invalidated.move_to_end(username)
+            while len(self._invalidated) > self.max_size:
+                _, evicted = self._invalidated.popitem(last=False)
+                self._evicted_generation = max(self._evicted_generation, evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+user_cache = UserCache(USER_CACHE_TTL_SECONDS, USER_CACHE_MAX_SIZE)
+
+class CurrentUser:
+    """
+    Lightweight principal returned by get_current_user.
+    Cached columns are served from the snapshot; any other attribute (or any write)
+    loads the full models.User row from the request's session on first use.
+    """
+    __slots__ = ("_snapshot", "_db", "_row")
+
+    def __init__(self, snapshot: dict, db: Optional[Session] = None, row: Optional[models.User] = None):
+        object.__setattr__(self, "_snapshot", snapshot)
+        object.__setattr__(self, "_db", db)
+        object.__setattr__(self, "_row", row)
+
+    @property
+    def row(self) -> models.User:
+        if self._row is None:
+            if self._db is None:
+                raise RuntimeError("CurrentUser has no session bound; load the user row explicitly.")
+            row = self._db.get(models.User, self._snapshot["id"])
+            if row is None:
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User no longer exists")
+            object.__setattr__(self, "_row", row)
+        return self._row
+
+    async def load_async(self, db: AsyncSession) -> models.User:
+        """Async counterpart of `row` for endpoints using database.get_async_db."""
+        if self._row is None:
+            row = await db.get(models.User, self._snapshot["id"])
+            if row is None:
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User no longer exists")
+            object.__setattr__(self, "_row", row)
+        return self._row
+
+    def detached(self) -> "CurrentUser":
+        """A snapshot-only copy for use after the request's session is gone (background jobs)."""
+        return CurrentUser(self._snapshot)
+
+    def __getattr__(self, name):
+        # Only called for names not found on the class (i.e. user fields)
+        if self._row is None and name in self._snapshot:
+            return self._snapshot[name]
+        return getattr(self.row, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.row, name, value)
+
 # --- Dependency: Get Current User ---
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+def decode_token(token: str) -> schemas.TokenData:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
-        token_data = schemas.TokenData(username=username)
+        return schemas.TokenData(username=username)
     except JWTError:
         raise credentials_exception
-        
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)) -> CurrentUser:
+    token_data = decode_token(token)
+
+    snapshot = user_cache.get(token_data.username)
+    if snapshot is not None:
+        return CurrentUser(snapshot, db)
+
+    read_generation = user_cache.generation()
     user = db.query(models.User).filter(models.User.username == token_data.username).first()
     if user is None:
         raise credentials_exception
-    return user
+    return CurrentUser(user_cache.put(user, read_generation), db, user)
+
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_async_db)) -> CurrentUser:
+    """Same as get_current_user, for `async def` endpoints using database.get_async_db."""
+    token_data = decode_token(token)
+
+    snapshot = user_cache.get(token_data.username)
+    if snapshot is not None:
+        return CurrentUser(snapshot)
+
+    read_generation = user_cache.generation()
+    result = await db.execute(select(models.User).where(models.User.username == token_data.username))
+    user = result.scalars().first()
+    if user is None:
+        raise credentials_exception
+    return CurrentUser(user_cache.put(user, read_generation), row=user)
@@ -0,0 +1,123 @@
+"""
+Concurrency benchmark for coin balance updates.
+
+Hammers a single user's balance from many threads (each with its own session, like
+concurrent requests) and compares the old read-modify-write pattern with
+coin_service.grant / coin_service.spend.
+
+Usage:
+    python bench_coins.py [--threads 16] [--requests 200] [--database-url postgresql://...]
+"""
+import os
+import time
+import argparse
+import tempfile
+import threading
+from sqlalchemy.orm import sessionmaker
+import database
+import models
+import coin_service
+
+def make_user(Session, coins: int = 0) -> int:
+    db = Session()
+    user = models.User(username=f"bench_{time.time_ns()}", email=f"{time.time_ns()}@bench", hashed_password="x", coins=coins)
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    db.close()
+    return user_id
+
+def read_balance(Session, user_id: int) -> int:
+    db = Session()
+    try:
+        return db.get(models.User, user_id).coins
+    finally:
+        db.close()
+
+def naive_grant(Session, user_id: int):
+    # The pre-coin_service pattern: load the row, add in Python, commit
+    db = Session()
+    try:
+        user = db.get(models.User, user_id)
+        user.coins += 1
+        db.commit()
+    finally:
+        db.close()
+
+def atomic_grant(Session, user_id: int):
+    db = Session()
+    try:
+        coin_service.grant(db, user_id, 1, "bench")
+        db.commit()
+    finally:
+        db.close()
+
+def hammer(fn, Session, user_id: int, threads: int, requests: int):
+    errors = []
+
+    def worker():
+        for _ in range(requests):
+            try:
+                fn(Session, user_id)
+            except Exception as e: # busy timeouts etc.
+                errors.append(e)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return time.perf_counter() - start, errors
+
+def bench_grants(Session, threads: int, requests: int):
+    expected = threads * requests
+    for name, fn in (("read-modify-write", naive_grant), ("coin_service.grant", atomic_grant)):
+        user_id = make_user(Session)
+        elapsed, errors = hammer(fn, Session, user_id, threads, requests)
+        balance = read_balance(Session, user_id)
+        lost = expected - len(errors) - balance
+        print(f"{name:<20} {expected / elapsed:8.0f} req/s  balance={balance:<6} expected={expected - len(errors):<6} lost updates={lost:<5} errors={len(errors)}")
+
+def bench_spends(Session, threads: int):
+    # 10 purchases can be afforded; everyone else must be refused and the balance must never go negative
+    price, affordable = 10, 10
+    user_id = make_user(Session, coins=price * affordable)
+    successes = []
+
+    def buyer():
+        db = Session()
+        try:
+            if coin_service.spend(db, user_id, price, "bench") is not None:
+                successes.append(1)
+            db.commit()
+        finally:
+            db.close()
+
+    pool = [threading.Thread(target=buyer) for _ in range(threads * 4)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    balance = read_balance(Session, user_id)
+    print(f"{'coin_service.spend':<20} {len(pool)} buyers, {len(successes)} succeeded (expected {affordable}), final balance={balance}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--database-url", default=None, help="Defaults to a throwaway SQLite file")
+    args = parser.parse_args()
+
+    url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine = database.build_engine(url)
+    models.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    print(f"--- {args.threads} threads x {args.requests} grants on one user ({engine.dialect.name}) ---")
+    bench_grants(Session, args.threads, args.requests)
+    bench_spends(Session, args.threads)
+    engine.dispose()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmarks image preprocessing before model upload (image_pipeline).
+
+Before: the SDK sends the uploaded file as-is (full resolution, EXIF included).
+After:  image_pipeline.pipeline.prepare() downsizes / strips / re-encodes on its process pool.
+
+For each image it reports payload bytes and the end-to-end time until the payload has been
+transmitted: local preparation plus upload at --uplink-mbps. It also measures event-loop lag
+while a batch is being prepared concurrently, to show the PIL work stays off the loop.
+
+Usage:
+    python bench_image_pipeline.py [--count 8] [--uplink-mbps 10] [images ...]
+"""
+import io
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import numpy as np
+from PIL import Image
+import image_pipeline
+
+def synthetic_photo(path: str, seed: int, size=(4032, 3024)):
+    """A 12 MP phone-like JPEG: smooth shapes plus sensor noise, with EXIF orientation and camera tags."""
+    rng = np.random.default_rng(seed)
+    w, h = size
+    base = Image.fromarray(rng.integers(0, 255, (24, 32, 3), dtype=np.uint8)).resize(size, Image.BICUBIC)
+    pixels = np.asarray(base, dtype=np.int16) + rng.normal(0, 6, (h, w, 3)).astype(np.int16)
+    image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    exif = Image.Exif()
+    exif[0x0112] = 6 # Orientation: rotate 90 CW
+    exif[0x010F] = "BenchCam"
+    exif[0x0110] = "Model 12MP"
+    image.save(path, format="JPEG", quality=92, exif=exif.tobytes())
+
+def before_payload(path: str) -> bytes:
+    # What generate_content_async([prompt, Image.open(path)]) sends: the file bytes unchanged
+    with Image.open(path) as image:
+        image.load()
+    with open(path, "rb") as f:
+        return f.read()
+
+def transfer_seconds(num_bytes: int, uplink_mbps: float) -> float:
+    return num_bytes * 8 / (uplink_mbps * 1_000_000)
+
+async def measure_loop_lag(stop: asyncio.Event) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.005)
+        worst = max(worst, time.perf_counter() - start - 0.005)
+    return worst
+
+async def run(paths, uplink_mbps: float):
+    pipeline = image_pipeline.pipeline
+    await pipeline.prepare(paths[0]) # start the worker processes outside the measurement
+
+    print(f"{'image':<22} {'before':>10} {'after':>10} {'saved':>7} {'before e2e':>11} {'after e2e':>10}")
+    totals = [0, 0, 0.0, 0.0]
+    for path in paths:
+        start = time.perf_counter()
+        before = before_payload(path)
+        before_prep = time.perf_counter() - start
+
+        start = time.perf_counter()
+        blob = await pipeline.prepare(path)
+        after_prep = time.perf_counter() - start
+
+        before_e2e = before_prep + transfer_seconds(len(before), uplink_mbps)
+        after_e2e = after_prep + transfer_seconds(len(blob["data"]), uplink_mbps)
+        totals[0] += len(before)
+        totals[1] += len(blob["data"])
+        totals[2] += before_e2e
+        totals[3] += after_e2e
+        print(f"{os.path.basename(path)[:22]:<22} {len(before) / 1024:>8.0f}KB {len(blob['data']) / 1024:>8.0f}KB "
+              f"{1 - len(blob['data']) / len(before):>6.0%} {before_e2e * 1000:>9.0f}ms {after_e2e * 1000:>8.0f}ms")
+
+    n = len(paths)
+    print(f"{'average':<22} {totals[0] / n / 1024:>8.0f}KB {totals[1] / n / 1024:>8.0f}KB "
+          f"{1 - totals[1] / totals[0]:>6.0%} {totals[2] / n * 1000:>9.0f}ms {totals[3] / n * 1000:>8.0f}ms")
+
+    # Concurrent batch: the event loop should stay responsive while workers decode
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(pipeline.prepare(path) for path in paths))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    lag = await lag_task
+    print(f"\n{n} images concurrently on {pipeline.pool.workers} workers: {elapsed * 1000:.0f}ms total, "
+          f"worst event-loop lag {lag * 1000:.1f}ms")
+    print(f"(uplink {uplink_mbps} Mbit/s, max edge {image_pipeline.IMAGE_MAX_EDGE}px, {image_pipeline.IMAGE_FORMAT} q{image_pipeline.IMAGE_QUALITY})")
+    pipeline.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("images", nargs="*", help="Image files to use instead of synthetic 12 MP photos")
+    parser.add_argument("--count", type=int, default=8)
+    parser.add_argument("--uplink-mbps", type=float, default=10.0)
+    args = parser.parse_args()
+
+    paths = args.images
+    if not paths:
+        tmp = tempfile.mkdtemp()
+        paths = []
+        for i in range(args.count):
+            path = os.path.join(tmp, f"photo_{i}.jpg")
+            synthetic_photo(path, seed=i)
+            paths.append(path)
+    asyncio.run(run(paths, args.uplink_mbps))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmarks the local image quality gate (image_quality).
+
+For 12 MP phone-like JPEGs (sharp, blurred, dark, overexposed) it reports:
+  - the verdict and sharpness score,
+  - score(): the NumPy metrics alone on the analysis-size grayscale array,
+  - assess(): decode + metrics, as used by /check-image-quality,
+  - the extra cost the gate adds inside image_pipeline.preprocess_image, which already
+    decodes the image for the model (and skips re-encoding when the gate rejects it).
+
+Usage:
+    python bench_image_quality.py [--repeat 10] [images ...]
+"""
+import io
+import time
+import random
+import argparse
+from PIL import Image, ImageDraw, ImageEnhance, ImageFilter
+import image_quality
+import image_pipeline
+from bench_image_pipeline import synthetic_photo
+
+def detailed_photo(path: str, seed: int):
+    """synthetic_photo plus sharp-edged shapes, so the 'sharp' variant has real detail."""
+    synthetic_photo(path, seed)
+    rnd = random.Random(seed)
+    with Image.open(path) as image:
+        exif = image.info.get("exif", b"")
+        image = image.convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for _ in range(300):
+        x, y = rnd.randrange(image.width), rnd.randrange(image.height)
+        w, h = rnd.randrange(20, 400), rnd.randrange(20, 400)
+        fill = tuple(rnd.randrange(256) for _ in range(3))
+        if rnd.random() < 0.5:
+            draw.rectangle((x, y, x + w, y + h), outline=fill, width=rnd.randrange(2, 12))
+        else:
+            draw.line((x, y, x + w, y + h), fill=fill, width=rnd.randrange(2, 12))
+    image.save(path, format="JPEG", quality=92, exif=exif)
+
+def variants(path: str):
+    """The image as-is plus blurred, dark and overexposed copies, as JPEG bytes."""
+    with Image.open(path) as image:
+        image = image.convert("RGB")
+        blurred = image.filter(ImageFilter.GaussianBlur(max(image.size) / 150)) # out of focus / motion
+        dark = ImageEnhance.Brightness(image).enhance(0.12)
+        bright = ImageEnhance.Brightness(image).enhance(4.0)
+    for name, image in [("sharp", image), ("blurred", blurred), ("dark", dark), ("overexposed", bright)]:
+        out = io.BytesIO()
+        image.save(out, format="JPEG", quality=90)
+        yield name, out.getvalue()
+
+def timed(fn, repeat: int):
+    """Result and best-of-`repeat` time in ms (the minimum is the least noisy estimate)."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("images", nargs="*", help="Image files to use instead of a synthetic 12 MP photo")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    paths = args.images
+    if not paths:
+        paths = ["/tmp/bench_quality_photo.jpg"]
+        detailed_photo(paths[0], seed=0)
+
+    print(f"{'image':<30} {'verdict':<12} {'sharp':>7} {'score()':>8} {'assess()':>9} {'pipeline':>9} {'+gate':>8}")
+    for path in paths:
+        for name, data in variants(path):
+            with Image.open(io.BytesIO(data)) as image:
+                gray = image_quality.analysis_gray(image)
+                size = image.size
+            _, score_ms = timed(lambda: image_quality.score(gray, size), args.repeat)
+            report, assess_ms = timed(lambda: image_quality.assess(data), args.repeat)
+            _, plain_ms = timed(lambda: image_pipeline.preprocess_image(data), args.repeat)
+            _, gated_ms = timed(lambda: image_pipeline.preprocess_image(data, check_quality=True), args.repeat)
+            verdict = "ok" if report["quality_ok"] else report["issues"][0]
+            label = f"{path.rsplit('/', 1)[-1][:18]} {name}"
+            print(f"{label:<30} {verdict:<12} {report['metrics']['sharpness']:>7.0f} {score_ms:>6.2f}ms "
+                  f"{assess_ms:>7.1f}ms {plain_ms:>7.1f}ms {gated_ms - plain_ms:>+6.1f}ms")
+
+    print(f"\n(analysis edge {image_quality.ANALYSIS_EDGE}px, blur threshold {image_quality.IMAGE_BLUR_THRESHOLD}, "
+          f"'+gate' is the gated preprocess time minus the plain one)")
+
+if __name__ == "__main__":
+    main()
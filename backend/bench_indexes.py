@@ -0,0 +1,182 @@
+"""
+Benchmarks the hot lookup queries on the baseline schema against the indexes and
+queries that models.py / main.py use now.
+
+Builds a throwaway SQLite database with 100k users (plus progress and challenge completions),
+drops every index the baseline schema did not have, times the baseline queries, then runs
+migrations.run_migrations and times the current queries (e.g. the period_key lookups of
+/challenges and complete_challenge in place of completion_date ranges).
+
+Usage:
+    python bench_indexes.py [--users 100000]
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+from datetime import date, timedelta
+from sqlalchemy import text
+import database
+import models
+import migrations
+
+# The baseline schema only had the single-column index=True indexes on these tables;
+# everything else on them was added since and is dropped to reproduce it
+BENCH_TABLES = [models.User.__table__, models.UserProgress.__table__, models.UserChallengeCompletion.__table__]
+BASELINE_INDEXES = {
+    "ix_users_id", "ix_users_username", "ix_users_email",
+    "ix_user_progress_id", "ix_user_challenge_completions_id",
+}
+NEW_INDEXES = sorted(ix.name for table in BENCH_TABLES for ix in table.indexes if ix.name not in BASELINE_INDEXES)
+LEVELS = 10
+CHALLENGE_TYPES = {1: "daily", 2: "daily", 3: "weekly", 4: "weekly"}
+LOOKUPS = 2000
+
+def populate(engine, users: int):
+    rng = random.Random(42)
+    today = date.today()
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO challenges (id, title, type, is_active) VALUES (:id, :t, :type, 1)"),
+            [{"id": cid, "t": f"challenge{cid}", "type": ctype} for cid, ctype in CHALLENGE_TYPES.items()],
+        )
+        conn.execute(
+            text("INSERT INTO users (id, username, email, hashed_password, coins, streak) VALUES (:id, :u, :e, 'x', :c, :s)"),
+            [{"id": i, "u": f"user{i}", "e": f"user{i}@example.com", "c": rng.randint(0, 5000), "s": rng.randint(0, 30)}
+             for i in range(1, users + 1)],
+        )
+        progress = []
+        for user_id in range(1, users + 1):
+            for level_id in range(1, rng.randint(1, LEVELS) + 1):
+                progress.append({"u": user_id, "l": level_id, "st": "completed", "sc": rng.randint(0, 5)})
+        conn.execute(text("INSERT INTO user_progress (user_id, level_id, status, score) VALUES (:u, :l, :st, :sc)"), progress)
+
+        # At most one completion per challenge period, as the unique index requires
+        completions, seen = [], set()
+        for user_id in range(1, users + 1):
+            for _ in range(rng.randint(0, 6)):
+                challenge_id = rng.randint(1, len(CHALLENGE_TYPES))
+                day = today - timedelta(days=rng.randint(0, 60))
+                key = models.challenge_period_key(CHALLENGE_TYPES[challenge_id], day)
+                if (user_id, challenge_id, key) not in seen:
+                    seen.add((user_id, challenge_id, key))
+                    completions.append({"u": user_id, "c": challenge_id, "d": day, "k": key})
+        conn.execute(text(
+            "INSERT INTO user_challenge_completions (user_id, challenge_id, completion_date, period_key) VALUES (:u, :c, :d, :k)"
+        ), completions)
+    return len(progress), len(completions)
+
+def lookup_params(rng, users: int) -> dict:
+    today = date.today()
+    return {
+        "u": rng.randint(1, users),
+        "l": rng.randint(1, LEVELS),
+        "today": today,
+        "week_start": today - timedelta(days=today.weekday()),
+        "since": today - timedelta(days=30),
+        "day_key": models.challenge_period_key("daily", today),
+        "week_key": models.challenge_period_key("weekly", today),
+    }
+
+# name -> (baseline statements, current statements, repeat); one "query" runs every statement once
+DAILY_CHECK = "SELECT id FROM user_challenge_completions WHERE user_id = :u AND challenge_id = {c} AND completion_date = :today LIMIT 1"
+WEEKLY_CHECK = "SELECT id FROM user_challenge_completions WHERE user_id = :u AND challenge_id = {c} AND completion_date >= :week_start LIMIT 1"
+PERIOD_CHECK = "SELECT id FROM user_challenge_completions WHERE user_id = :u AND challenge_id = {c} AND period_key = {key}"
+PROGRESS_LOOKUP = "SELECT * FROM user_progress WHERE user_id = :u AND level_id = :l LIMIT 1"
+RECENT_COMPLETIONS = ("SELECT challenge_id, completion_date FROM user_challenge_completions WHERE user_id = :u "
+                      "AND completion_date >= :since ORDER BY completion_date DESC, id DESC LIMIT 20")
+LEADERBOARD_TOP = "SELECT username, coins, streak FROM users ORDER BY coins DESC, streak DESC LIMIT 10"
+QUERIES = {
+    "progress (user_id, level_id)": (
+        [PROGRESS_LOOKUP],
+        [PROGRESS_LOOKUP],
+        LOOKUPS,
+    ),
+    "complete_challenge check (daily)": (
+        [DAILY_CHECK.format(c=1)],
+        [PERIOD_CHECK.format(c=1, key=":day_key")],
+        LOOKUPS,
+    ),
+    "complete_challenge check (weekly)": (
+        [WEEKLY_CHECK.format(c=3)],
+        [PERIOD_CHECK.format(c=3, key=":week_key")],
+        LOOKUPS,
+    ),
+    "/challenges status (4 challenges)": (
+        [(DAILY_CHECK if ctype == "daily" else WEEKLY_CHECK).format(c=cid) for cid, ctype in CHALLENGE_TYPES.items()],
+        ["SELECT challenge_id, period_key FROM user_challenge_completions WHERE user_id = :u "
+         "AND challenge_id IN (1, 2, 3, 4) AND period_key IN (:day_key, :week_key)"],
+        LOOKUPS,
+    ),
+    "/users/me recent completions": (
+        [RECENT_COMPLETIONS],
+        [RECENT_COMPLETIONS],
+        LOOKUPS,
+    ),
+    "leaderboard top 10": (
+        [LEADERBOARD_TOP],
+        [LEADERBOARD_TOP],
+        50,
+    ),
+}
+
+def run_queries(engine, users: int, phase: int) -> dict:
+    """Times QUERIES[name][phase]: 0 = baseline statements, 1 = current statements"""
+    results = {}
+    with engine.connect() as conn:
+        for name, entry in QUERIES.items():
+            statements, repeat = entry[phase], entry[2]
+            rng = random.Random(7)
+            sample = lookup_params(rng, users)
+            plans = []
+            for sql in statements:
+                plan = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"), used_params(sql, sample)).fetchall()
+                plans.append(" | ".join(row[-1] for row in plan))
+            start = time.perf_counter()
+            for _ in range(repeat):
+                params = lookup_params(rng, users)
+                for sql in statements:
+                    conn.execute(text(sql), used_params(sql, params)).fetchall()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            results[name] = {"plan": " || ".join(dict.fromkeys(plans)), "ms_per_query": elapsed_ms / repeat}
+    return results
+
+def used_params(sql: str, params: dict) -> dict:
+    return {k: v for k, v in params.items() if f":{k}" in sql}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100_000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = database.build_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for name in NEW_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+    print(f"Dropped for the baseline run: {', '.join(NEW_INDEXES)}")
+    print(f"--- Populating {args.users:,} users ---")
+    start = time.perf_counter()
+    n_progress, n_completions = populate(engine, args.users)
+    print(f"{n_progress:,} progress rows, {n_completions:,} completions in {time.perf_counter() - start:.1f}s")
+
+    before = run_queries(engine, args.users, 0)
+    start = time.perf_counter()
+    migrations.run_migrations(engine)
+    print(f"Migration applied in {time.perf_counter() - start:.1f}s")
+    after = run_queries(engine, args.users, 1)
+
+    for name in QUERIES:
+        b, a = before[name], after[name]
+        print(f"\n{name}")
+        print(f"  before: {b['ms_per_query']:8.3f} ms/query  plan: {b['plan']}")
+        print(f"  after:  {a['ms_per_query']:8.3f} ms/query  plan: {a['plan']}")
+        print(f"  speedup: {b['ms_per_query'] / max(a['ms_per_query'], 1e-9):.0f}x")
+
+    engine.dispose()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmarks Argon2 cost parameters on this host and writes the strongest setting
+that fits the latency budget to .env (ARGON2_TIME_COST / ARGON2_MEMORY_COST / ARGON2_PARALLELISM).
+
+Usage:
+    python calibrate_argon2.py --target-ms 250
+    python calibrate_argon2.py --target-ms 150 --max-memory-mb 64 --dry-run
+
+Existing hashes keep working; they are rehashed with the new parameters on the user's next login.
+"""
+import os
+import time
+import argparse
+import statistics
+import hashing
+
+# OWASP Password Storage Cheat Sheet: equivalent Argon2id minimums, (memory KiB, time cost).
+# Less memory needs more passes; never calibrate below the pair for a memory size.
+OWASP_MINIMUMS = [
+    (46 * 1024, 1),
+    (19 * 1024, 2),
+    (12 * 1024, 3),
+    (9 * 1024, 4),
+    (7 * 1024, 5),
+]
+MIN_MEMORY_KIB = OWASP_MINIMUMS[-1][0]
+MAX_TIME_COST = 10
+SAMPLES = 3
+
+def min_time_cost(memory_kib: int) -> int:
+    """The fewest passes OWASP allows at this memory size (memory_kib >= MIN_MEMORY_KIB)."""
+    return next(time_cost for floor_kib, time_cost in OWASP_MINIMUMS if memory_kib >= floor_kib)
+
+def measure_ms(time_cost: int, memory_kib: int, parallelism: int) -> float:
+    context = hashing.build_context(time_cost=time_cost, memory_cost=memory_kib, parallelism=parallelism)
+    context.hash("warm-up")
+    timings = []
+    for _ in range(SAMPLES):
+        start = time.perf_counter()
+        context.hash("calibration-password")
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def calibrate(target_ms: float, max_memory_kib: int, parallelism: int):
+    """
+    Walks memory sizes from largest to smallest and, for each, the highest time cost
+    under budget. Prefers memory (harder to attack on GPUs) over extra passes.
+    """
+    memory_kib = max_memory_kib
+    best = None
+    while memory_kib >= MIN_MEMORY_KIB:
+        for time_cost in range(min_time_cost(memory_kib), MAX_TIME_COST + 1):
+            elapsed = measure_ms(time_cost, memory_kib, parallelism)
+            print(f"  m={memory_kib // 1024:>4} MiB  t={time_cost:>2}  p={parallelism}  ->  {elapsed:7.1f} ms")
+            if elapsed > target_ms:
+                break
+            if best is None or memory_kib * time_cost > best["memory_cost"] * best["time_cost"]:
+                best = {"time_cost": time_cost, "memory_cost": memory_kib, "parallelism": parallelism, "ms": elapsed}
+        if best is not None:
+            return best
+        if memory_kib == MIN_MEMORY_KIB:
+            break
+        memory_kib = max(memory_kib // 2, MIN_MEMORY_KIB) # the last step tries the OWASP floor itself
+    return None
+
+def write_env(path: str, values: dict):
+    """Updates (or appends) KEY=value lines in a .env file, leaving other lines untouched."""
+    lines = []
+    if os.path.exists(path):
+        with open(path) as f:
+            lines = f.read().splitlines()
+
+    remaining = dict(values)
+    for i, line in enumerate(lines):
+        key = line.split("=", 1)[0].strip()
+        if key in remaining:
+            lines[i] = f"{key}={remaining.pop(key)}"
+    lines.extend(f"{key}={value}" for key, value in remaining.items())
+
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate Argon2 cost for this host.")
+    parser.add_argument("--target-ms", type=float, default=float(os.getenv("ARGON2_TARGET_MS", 250)))
+    parser.add_argument("--max-memory-mb", type=int, default=64)
+    parser.add_argument("--parallelism", type=int, default=1)
+    parser.add_argument("--env-file", default=".env")
+    parser.add_argument("--dry-run", action="store_true", help="Print the result without writing .env")
+    args = parser.parse_args()
+
+    print(f"--- Calibrating Argon2 for a {args.target_ms:.0f} ms budget ---")
+    best = calibrate(args.target_ms, args.max_memory_mb * 1024, args.parallelism)
+
+    if best is None:
+        print(f"❌ No OWASP minimum setting (down to m={MIN_MEMORY_KIB // 1024} MiB, t={min_time_cost(MIN_MEMORY_KIB)}) fits {args.target_ms:.0f} ms. Raise the budget or use a larger instance.")
+        return
+
+    print(f"✅ Chosen: time_cost={best['time_cost']} memory_cost={best['memory_cost']} KiB parallelism={best['parallelism']} (~{best['ms']:.0f} ms)")
+    values = {
+        hashing.ARGON2_SETTINGS_ENV["time_cost"]: best["time_cost"],
+        hashing.ARGON2_SETTINGS_ENV["memory_cost"]: best["memory_cost"],
+        hashing.ARGON2_SETTINGS_ENV["parallelism"]: best["parallelism"],
+    }
+    if args.dry_run:
+        for key, value in values.items():
+            print(f"{key}={value}")
+    else:
+        write_env(args.env_file, values)
+        print(f"Written to {args.env_file}. Restart the API to apply; users are rehashed on their next login.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+from sqlalchemy import event, update, insert, select
+from sqlalchemy.orm import Session, selectinload
+import models
+
+# --- Catalog Version Stamps ---
+# Levels (with their questions), store items, challenges and the community feed rarely
+# change, so clients keep a local copy and ask GET /sync?since=<version> for what changed.
+# Every flush that inserts, modifies or deletes catalog rows takes the next value of a
+# single counter (models.SyncState) and stamps it on those rows; deletions leave a
+# models.SyncTombstone. This happens in a Session hook, so seeding and any admin write
+# through the ORM are covered without extra calls. Bulk query().delete()/update() bypass it.
+#
+# The counter row is updated in the writer's transaction and stays locked until it
+# commits, so versions become visible in increasing order.
+
+CATALOG_TABLES = {
+    models.Level: "levels",
+    models.StoreItem: "store_items",
+    models.Challenge: "challenges",
+    models.CommunityFeed: "community_feed",
+}
+CATALOG_MODELS = tuple(CATALOG_TABLES)
+
+def next_version(conn) -> int:
+    stmt = (
+        update(models.SyncState.__table__)
+        .where(models.SyncState.id == 1)
+        .values(version=models.SyncState.version + 1)
+        .returning(models.SyncState.version)
+    )
+    version = conn.execute(stmt).scalar_one_or_none()
+    if version is None:
+        conn.execute(insert(models.SyncState.__table__).values(id=1, version=1))
+        version = 1
+    return version
+
+def current_version(db: Session) -> int:
+    return db.scalar(select(models.SyncState.version).where(models.SyncState.id == 1)) or 0
+
+@event.listens_for(Session, "before_flush")
+def _stamp_versions(session: Session, flush_context, instances):
+    changed = [obj for obj in session.new if isinstance(obj, CATALOG_MODELS)]
+    changed += [
+        obj for obj in session.dirty
+        if isinstance(obj, CATALOG_MODELS) and session.is_modified(obj, include_collections=False)
+    ]
+    deleted = [obj for obj in session.deleted if isinstance(obj, CATALOG_MODELS)]
+
+    # Questions are served inside their level, so a question change re-stamps the level
+    level_ids = {
+        obj.level_id for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+        if isinstance(obj, models.Question) and obj.level_id is not None
+    }
+    for level_id in level_ids:
+        level = session.get(models.Level, level_id)
+        if level is not None and level not in changed and level not in session.deleted:
+            changed.append(level)
+
+    if not changed and not deleted:
+        return
+
+    version = next_version(session.connection())
+    for obj in changed:
+        obj.version = version
+    for obj in deleted:
+        session.add(models.SyncTombstone(table_name=CATALOG_TABLES[type(obj)], row_id=obj.id, version=version))
+
+# --- Delta Payload ---
+
+def changes_since(db: Session, since: int = 0) -> dict:
+    """
+    Catalog rows stamped after `since`, plus ids removed since then, grouped by table.
+    `full` is True when the client must replace its copy instead of merging: first sync
+    (since=0) or a version this server never issued (e.g. after a database reset).
+    """
+    version = current_version(db)
+    full = since <= 0 or since > version
+    if full:
+        since = 0
+
+    def changed(model):
+        query = db.query(model)
+        if not full:
+            query = query.filter(model.version > since)
+        return query
+
+    deleted = {table: [] for table in CATALOG_TABLES.values()}
+    if not full:
+        tombstones = db.query(models.SyncTombstone.table_name, models.SyncTombstone.row_id).filter(
+            models.SyncTombstone.version > since
+        )
+        for table_name, row_id in tombstones:
+            deleted[table_name].append(row_id)
+
+    levels = changed(models.Level).options(selectinload(models.Level.questions)).order_by(models.Level.id).all()
+    for level in levels:
+        level.questions.sort(key=lambda q: q.id)
+
+    # Deactivated challenges leave the client's list just like deleted ones
+    challenges = []
+    for challenge in changed(models.Challenge).order_by(models.Challenge.id):
+        if challenge.is_active:
+            challenges.append(challenge)
+        elif not full:
+            deleted["challenges"].append(challenge.id)
+
+    return {
+        "version": version,
+        "full": full,
+        "levels": levels,
+        "store_items": changed(models.StoreItem).order_by(models.StoreItem.id).all(),
+        "challenges": challenges,
+        "community_feed": changed(models.CommunityFeed).order_by(models.CommunityFeed.created_at.desc()).all(),
+        "deleted": deleted,
+    }
@@ -0,0 +1,94 @@
+from datetime import date, timedelta
+from typing import Optional
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+import database
+import models
+
+# --- Coin Ledger ---
+# Every change to User.coins is appended to models.CoinLedger in the same transaction,
+# and coins *earned* are rolled up per day and per ISO week so windowed leaderboards
+# read one small table instead of scanning history. Spending is recorded in the ledger
+# but does not reduce the rollups: they rank what users earned in the window.
+
+REASON_LEVEL = "level"
+REASON_SCAN = "scan"
+REASON_CHALLENGE = "challenge"
+REASON_PURCHASE = "purchase"
+
+def week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+def _upsert_total(db: Session, model, period_column: str, period_value: date, user_id: int, delta: int):
+    stmt = database.upsert_statement(
+        db.get_bind().dialect.name, model,
+        values={"user_id": user_id, "coins": delta, period_column: period_value},
+        index_elements=["user_id", period_column],
+        set_={"coins": model.coins + delta},
+    )
+    if stmt is not None:
+        db.execute(stmt)
+        return
+
+    # Generic fallback for other backends
+    row = db.query(model).filter(model.user_id == user_id, getattr(model, period_column) == period_value).first()
+    if row:
+        row.coins += delta
+    else:
+        db.add(model(user_id=user_id, coins=delta, **{period_column: period_value}))
+
+def record_coin_change(db: Session, user_id: int, delta: int, reason: str, today: Optional[date] = None):
+    """
+    Logs a coin change and updates the rollups. Does not commit; call it in the same
+    transaction as the balance update. Async callers use `await db.run_sync(...)`.
+    """
+    if not delta:
+        return
+    today = today or date.today()
+    db.add(models.CoinLedger(user_id=user_id, delta=delta, reason=reason, day=today))
+    if delta > 0:
+        _upsert_total(db, models.DailyCoinTotal, "day", today, user_id, delta)
+        _upsert_total(db, models.WeeklyCoinTotal, "week_start", week_start(today), user_id, delta)
+
+# --- Atomic Balance Updates ---
+# Balances are changed with a single UPDATE ... RETURNING instead of read-modify-write
+# on a previously loaded ORM object, so concurrent requests from the same user can't
+# lose updates. None of these commit; async callers use `await db.run_sync(...)`.
+
+def _sync_loaded_user(db: Session, user_id: int, balance: int):
+    # Keep an already-loaded User row consistent without marking it dirty
+    user = db.identity_map.get(identity_key(models.User, user_id))
+    if user is not None:
+        set_committed_value(user, "coins", balance)
+
+def grant(db: Session, user_id: int, delta: int, reason: str) -> int:
+    """Adds `delta` coins (may be negative) and returns the new balance."""
+    stmt = (
+        update(models.User)
+        .where(models.User.id == user_id)
+        .values(coins=models.User.coins + delta)
+        .returning(models.User.coins)
+        .execution_options(synchronize_session=False)
+    )
+    balance = db.execute(stmt).scalar_one()
+    _sync_loaded_user(db, user_id, balance)
+    record_coin_change(db, user_id, delta, reason)
+    return balance
+
+def spend(db: Session, user_id: int, price: int, reason: str) -> Optional[int]:
+    """Deducts `price` only if the balance covers it. Returns the new balance, or None if insufficient."""
+    stmt = (
+        update(models.User)
+        .where(models.User.id == user_id, models.User.coins >= price)
+        .values(coins=models.User.coins - price)
+        .returning(models.User.coins)
+        .execution_options(synchronize_session=False)
+    )
+    balance = db.execute(stmt).scalar_one_or_none()
+    if balance is None:
+        return None
+    _sync_loaded_user(db, user_id, balance)
+    record_coin_change(db, user_id, -price, reason)
+    return balance
@@ -0,0 +1,50 @@
+import os
+from passlib.context import CryptContext
+from dotenv import load_dotenv
+import process_pool
+
+load_dotenv()
+
+# --- Password Hashing Pool ---
+# Argon2 is deliberately CPU and memory heavy. Running it on Starlette's shared
+# threadpool lets a burst of logins starve every other sync endpoint, so hashing
+# gets its own process pool with a bounded backlog instead.
+
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", min(4, os.cpu_count() or 1)))
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", 64)) # queued + running before we answer 503
+
+# Argon2 cost parameters. Unset values fall back to passlib's defaults;
+# run `python calibrate_argon2.py` on the target host to pick them for a latency budget.
+ARGON2_SETTINGS_ENV = {
+    "time_cost": "ARGON2_TIME_COST",
+    "memory_cost": "ARGON2_MEMORY_COST", # KiB
+    "parallelism": "ARGON2_PARALLELISM",
+}
+
+def argon2_settings() -> dict:
+    return {key: int(os.getenv(env)) for key, env in ARGON2_SETTINGS_ENV.items() if os.getenv(env)}
+
+def build_context(**settings) -> CryptContext:
+    return CryptContext(
+        schemes=["argon2"],
+        deprecated="auto",
+        **{f"argon2__{key}": value for key, value in settings.items()},
+    )
+
+pwd_context = build_context(**argon2_settings())
+
+# These run inside the worker processes, so they must stay top-level functions.
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+def verify_and_update(plain_password: str, hashed_password: str):
+    """
+    Returns (is_valid, new_hash). new_hash is set when the stored hash was made
+    with outdated parameters and should replace it.
+    """
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+pool = process_pool.BoundedProcessPool(HASH_WORKERS, HASH_MAX_PENDING)
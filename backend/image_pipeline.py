@@ -0,0 +1,201 @@
+import io
+import os
+import math
+import time
+import threading
+from typing import Optional, Tuple, Union
+from PIL import Image, ImageOps
+import image_quality
+import process_pool
+
+# --- Image Preprocessing ---
+# Phone photos are often 12 MP+ JPEGs carrying EXIF/GPS metadata. Before an image goes to
+# the model it is decoded at reduced scale, rotated per its EXIF orientation, shrunk to
+# IMAGE_MAX_EDGE, stripped of metadata and re-encoded compactly. A JPEG that needs neither
+# shrinking nor rotation is sent as-is minus its metadata segments whenever that is smaller
+# than the re-encode (already-compressed uploads would only grow). The PIL work runs on a
+# bounded process pool of its own (process_pool), so it never blocks
+# the event loop or holds the GIL for other requests.
+
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", 1536))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").upper() # 'JPEG' or 'WEBP'
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", 85))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", min(4, os.cpu_count() or 1)))
+IMAGE_MAX_PENDING = int(os.getenv("IMAGE_MAX_PENDING", 32))
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+# JPEG segments kept when stripping metadata: APP0 (JFIF) and APP14 (Adobe color transform)
+# affect decoding; every other APPn (EXIF, XMP, ICC, maker notes) and comments are dropped
+JPEG_KEPT_APP_MARKERS = {0xE0, 0xEE}
+
+def strip_jpeg_metadata(data: bytes) -> Optional[bytes]:
+    """The JPEG without its APPn/COM metadata segments, losslessly, or None if it can't be parsed."""
+    if data[:2] != b"\xff\xd8":
+        return None
+    out = [data[:2]]
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF: # fill byte
+            pos += 1
+            continue
+        if marker == 0xDA: # start of scan: the rest is entropy-coded image data
+            out.append(data[pos:])
+            return b"".join(out)
+        length = int.from_bytes(data[pos + 2:pos + 4], "big")
+        end = pos + 2 + length
+        if length < 2 or end > len(data):
+            return None
+        is_metadata = (0xE0 <= marker <= 0xEF and marker not in JPEG_KEPT_APP_MARKERS) or marker == 0xFE
+        if not is_metadata:
+            out.append(data[pos:end])
+        pos = end
+    return None
+
+def preprocess_image(source: Union[str, bytes], max_edge: int = IMAGE_MAX_EDGE, fmt: str = IMAGE_FORMAT, quality: int = IMAGE_QUALITY, check_quality: bool = False) -> dict:
+    """
+    Runs in a worker process. `source` is a file path or the raw bytes.
+    Returns the re-encoded image (or the metadata-stripped original JPEG, if no resize or
+    rotation is needed and that is smaller) as a Gemini blob dict plus size information.
+    With `check_quality`, the shrunk image is also scored by image_quality ('quality' key);
+    an image that fails is not re-encoded and 'blob' is None.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        original_bytes = len(source)
+        stream = io.BytesIO(source)
+    else:
+        original_bytes = os.path.getsize(source)
+        stream = source
+
+    with Image.open(stream) as image:
+        original_size = image.size
+        # Sending the original bytes needs a plain, upright JPEG (EXIF orientation 1)
+        passthrough = image.format == "JPEG" and image.mode in ("RGB", "L") and image.getexif().get(0x0112, 1) == 1
+        scale = min(1.0, max_edge / max(image.size))
+        # JPEG only: let libjpeg decode at 1/2, 1/4 or 1/8 scale while still covering the target size
+        image.draft("RGB", (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.thumbnail((max_edge, max_edge), Image.BICUBIC)
+
+        report = None
+        if check_quality:
+            report = image_quality.score(image_quality.analysis_gray(image), original_size)
+            if not report["quality_ok"]:
+                return {"blob": None, "quality": report, "original_bytes": original_bytes, "bytes": 0,
+                        "original_size": original_size, "size": image.size}
+
+        # Rotate after shrinking (cheaper); the bounding box is square so the result is the same
+        image = ImageOps.exif_transpose(image)
+
+        out = io.BytesIO()
+        # No exif= / icc_profile= arguments: metadata is dropped
+        if fmt == "WEBP":
+            image.save(out, format="WEBP", quality=quality, method=4)
+        else:
+            image.save(out, format="JPEG", quality=quality, optimize=True, progressive=True)
+        size = image.size
+
+    data = out.getvalue()
+    mime_type = MIME_TYPES.get(fmt, "image/jpeg")
+    kept_original = False
+    if passthrough and size == original_size:
+        if not isinstance(source, (bytes, bytearray)):
+            with open(source, "rb") as f:
+                source = f.read()
+        stripped = strip_jpeg_metadata(source)
+        if stripped is not None and len(stripped) <= len(data):
+            data, mime_type, kept_original = stripped, "image/jpeg", True
+
+    return {
+        "blob": {"mime_type": mime_type, "data": data},
+        "kept_original": kept_original,
+        "quality": report,
+        "original_bytes": original_bytes,
+        "bytes": len(data),
+        "original_size": original_size,
+        "size": size,
+    }
+
+class ImagePipeline:
+    def __init__(self, workers: int, max_pending: int):
+        self.pool = process_pool.BoundedProcessPool(workers, max_pending)
+        self._lock = threading.Lock()
+        self.images = 0
+        self.fallbacks = 0
+        self.kept_original = 0
+        self.rejected = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    async def prepare(self, source: Union[str, bytes], mime_type: str = "image/jpeg"):
+        """
+        A blob dict ready for generate_content. Falls back to the original bytes (and logs)
+        if the pool is saturated or the image can't be processed, so verification still runs.
+        """
+        blob, _ = await self._prepare(source, mime_type, False)
+        return blob
+
+    async def prepare_checked(self, source: Union[str, bytes], mime_type: str = "image/jpeg") -> Tuple[Optional[dict], Optional[dict]]:
+        """
+        Like prepare(), but also runs the image_quality gate on the decoded image.
+        Returns (blob, report); blob is None when the image failed the gate. When preprocessing
+        falls back to the original bytes, the gate still runs (image_quality.check).
+        """
+        return await self._prepare(source, mime_type, True)
+
+    async def _prepare(self, source, mime_type: str, check_quality: bool):
+        try:
+            result = await self.pool.run(preprocess_image, source, IMAGE_MAX_EDGE, IMAGE_FORMAT, IMAGE_QUALITY, check_quality)
+        except Exception as e:
+            print(f"⚠️ Image preprocessing skipped: {e.__class__.__name__}: {e}")
+            with self._lock:
+                self.fallbacks += 1
+            report = None
+            if check_quality:
+                report = await image_quality.check(source)
+                if not report["quality_ok"]:
+                    with self._lock:
+                        self.rejected += 1
+                    return None, report
+            if isinstance(source, (bytes, bytearray)):
+                return {"mime_type": mime_type, "data": bytes(source)}, report
+            with open(source, "rb") as f:
+                return {"mime_type": mime_type, "data": f.read()}, report
+
+        with self._lock:
+            if result["blob"] is None:
+                self.rejected += 1
+            else:
+                self.images += 1
+                self.kept_original += result["kept_original"]
+                self.bytes_in += result["original_bytes"]
+                self.bytes_out += result["bytes"]
+        return result["blob"], result["quality"]
+
+    def stats(self) -> dict:
+        with self._lock:
+            saved = self.bytes_in - self.bytes_out
+            stats = {
+                "images": self.images,
+                "fallbacks": self.fallbacks,
+                "kept_original": self.kept_original,
+                "rejected_low_quality": self.rejected,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "bytes_saved": saved,
+                "saved_ratio": round(saved / self.bytes_in, 3) if self.bytes_in else None,
+                "max_edge": IMAGE_MAX_EDGE,
+                "format": IMAGE_FORMAT,
+            }
+        stats["pool"] = self.pool.stats()
+        return stats
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+
+pipeline = ImagePipeline(IMAGE_WORKERS, IMAGE_MAX_PENDING)
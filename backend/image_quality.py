@@ -0,0 +1,107 @@
+import io
+import os
+import asyncio
+from typing import Tuple, Union
+import numpy as np
+from PIL import Image
+
+# --- Image Quality Gate ---
+# A cheap local check run before an image is sent to the model, so blurry, dark, blown-out,
+# blank or tiny photos are rejected in milliseconds instead of failing after a Gemini call.
+# Every metric is computed with NumPy on a grayscale array of at most ANALYSIS_EDGE pixels.
+# On the verification path the array comes from the image the preprocessing worker has
+# already decoded (image_pipeline), so the gate adds no second JPEG decode.
+
+IMAGE_MIN_EDGE = int(os.getenv("IMAGE_MIN_EDGE", 320)) # shortest side of the original, pixels
+IMAGE_BLUR_THRESHOLD = float(os.getenv("IMAGE_BLUR_THRESHOLD", 25)) # Laplacian variance at ANALYSIS_EDGE
+ANALYSIS_EDGE = 512
+
+DARK_LEVEL = 24 # gray levels at or below count as black
+BRIGHT_LEVEL = 245 # gray levels at or above count as blown out
+MAX_CLIPPED_FRACTION = 0.7
+MIN_MEAN_BRIGHTNESS = 30
+UNIFORM_STD = 6.0 # below this the frame is practically one flat colour
+
+MESSAGES = {
+    "too_small": "The photo resolution is too low. Please take a closer or higher-quality photo.",
+    "uniform": "The photo looks blank (a flat, featureless surface). Please photograph the item.",
+    "too_dark": "The photo is too dark. Please retake it with more light.",
+    "too_bright": "The photo is overexposed. Please avoid direct light or flash glare.",
+    "blurry": "The photo is too blurry. Hold the camera steady and let it focus before taking the picture.",
+}
+
+def analysis_gray(image: Image.Image) -> np.ndarray:
+    """Grayscale uint8 array of `image`, no larger than ANALYSIS_EDGE."""
+    gray = image.convert("L")
+    if max(gray.size) > ANALYSIS_EDGE:
+        gray.thumbnail((ANALYSIS_EDGE, ANALYSIS_EDGE), Image.BILINEAR)
+    return np.asarray(gray)
+
+def laplacian_variance(gray: np.ndarray) -> float:
+    """Variance of the 4-neighbour Laplacian; low values mean few edges, i.e. blur."""
+    g = gray.astype(np.float32)
+    lap = g[:-2, 1:-1] + g[2:, 1:-1] + g[1:-1, :-2] + g[1:-1, 2:] - 4 * g[1:-1, 1:-1]
+    return float(lap.var())
+
+def score(gray: np.ndarray, original_size: Tuple[int, int]) -> dict:
+    """
+    Quality report for an analysis_gray() array: {'quality_ok', 'message', 'issues', 'metrics'}.
+    `original_size` is the (width, height) of the uploaded image, for the resolution check.
+    """
+    width, height = original_size
+    hist = np.bincount(gray.ravel(), minlength=256)
+    pixels = gray.size
+    mean = float(np.dot(hist, np.arange(256)) / pixels)
+    std = float(gray.std())
+    dark = float(hist[:DARK_LEVEL + 1].sum() / pixels)
+    bright = float(hist[BRIGHT_LEVEL:].sum() / pixels)
+    sharpness = laplacian_variance(gray) if min(gray.shape) >= 3 else 0.0
+
+    # Most fundamental problem first: later checks are unreliable when an earlier one fails
+    issues = []
+    if min(width, height) < IMAGE_MIN_EDGE:
+        issues.append("too_small")
+    if dark > MAX_CLIPPED_FRACTION or mean < MIN_MEAN_BRIGHTNESS:
+        issues.append("too_dark")
+    elif bright > MAX_CLIPPED_FRACTION:
+        issues.append("too_bright")
+    elif std < UNIFORM_STD:
+        issues.append("uniform")
+    elif sharpness < IMAGE_BLUR_THRESHOLD:
+        issues.append("blurry")
+
+    return {
+        "quality_ok": not issues,
+        "message": MESSAGES[issues[0]] if issues else "Image quality looks good.",
+        "issues": issues,
+        "metrics": {
+            "width": width,
+            "height": height,
+            "sharpness": round(sharpness, 1),
+            "brightness": round(mean, 1),
+            "contrast": round(std, 1),
+            "dark_fraction": round(dark, 3),
+            "bright_fraction": round(bright, 3),
+        },
+    }
+
+def assess(source: Union[str, bytes]) -> dict:
+    """
+    Decodes and scores an image (raw bytes or a file path). Images that can't be decoded
+    pass unchecked, since the model may still read formats PIL doesn't.
+    """
+    try:
+        with Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source) as image:
+            original_size = image.size
+            scale = min(1.0, ANALYSIS_EDGE / max(image.size))
+            # JPEG only: decode at 1/2 .. 1/8 scale, close to the analysis size
+            image.draft("L", (max(1, round(image.width * scale)), max(1, round(image.height * scale))))
+            gray = analysis_gray(image)
+    except Exception as e:
+        print(f"⚠️ Image quality check skipped: {e.__class__.__name__}: {e}")
+        return {"quality_ok": True, "message": "Quality check skipped (unreadable image)", "issues": [], "metrics": None}
+    return score(gray, original_size)
+
+async def check(source: Union[str, bytes]) -> dict:
+    """assess() off the event loop (PIL decoding and NumPy release the GIL)."""
+    return await asyncio.to_thread(assess, source)
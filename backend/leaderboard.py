@@ -0,0 +1,169 @@
+import os
+import time
+import threading
+from datetime import date
+from typing import Optional
+from sortedcontainers import SortedList
+from sqlalchemy import func, or_, and_
+from sqlalchemy.orm import Session
+import models
+import coin_service
+
+# --- In-Memory Ranked Leaderboard ---
+# Built once at startup and updated incrementally by main.on_user_changed, so
+# /leaderboard and /leaderboard/me never scan the users table. Balance changes made
+# by other API processes are picked up from the append-only coin ledger: reads first
+# reload the users with ledger rows newer than the last one seen (at most once per
+# LEADERBOARD_CATCH_UP_SECONDS).
+
+LEADERBOARD_CATCH_UP_SECONDS = float(os.getenv("LEADERBOARD_CATCH_UP_SECONDS", 1.0))
+
+class Leaderboard:
+    """
+    Order-statistics view of all users ranked by coins DESC, streak DESC (ties by user id).
+    Inserts, removals and rank lookups are O(log n).
+    """
+    def __init__(self):
+        self._ranked = SortedList()  # (-coins, -streak, user_id)
+        self._entries = {}           # user_id -> (sort key, username)
+        self._lock = threading.Lock()
+        self._catch_up_lock = threading.Lock()
+        self._last_ledger_id = 0  # highest coin_ledger.id already reflected
+        self._caught_up_at = 0.0
+
+    @staticmethod
+    def _key(user_id: int, coins: Optional[int], streak: Optional[int]):
+        return (-(coins or 0), -(streak or 0), user_id)
+
+    @staticmethod
+    def _max_ledger_id(db: Session) -> int:
+        return db.query(func.max(models.CoinLedger.id)).scalar() or 0
+
+    def load(self, db: Session):
+        # Read the ledger position first: changes committed while the users are read are replayed by catch_up
+        last_ledger_id = self._max_ledger_id(db)
+        rows = db.query(models.User.id, models.User.username, models.User.coins, models.User.streak).all()
+        entries = {row.id: (self._key(row.id, row.coins, row.streak), row.username) for row in rows}
+        with self._lock:
+            self._entries = entries
+            self._ranked = SortedList(key for key, _ in entries.values())
+            self._last_ledger_id = last_ledger_id
+            self._caught_up_at = time.monotonic()
+
+    def catch_up(self, db: Session, force: bool = False) -> int:
+        """
+        Reloads the users whose balance changed since the last ledger row seen, including
+        changes made by other API processes. Returns how many users were refreshed.
+        """
+        if not force and time.monotonic() - self._caught_up_at < LEADERBOARD_CATCH_UP_SECONDS:
+            return 0
+        if not self._catch_up_lock.acquire(blocking=False):
+            return 0 # another request is already catching up
+        try:
+            since = self._last_ledger_id
+            changed = (
+                db.query(models.CoinLedger.user_id, func.max(models.CoinLedger.id))
+                .filter(models.CoinLedger.id > since)
+                .group_by(models.CoinLedger.user_id)
+                .all()
+            )
+            if changed:
+                user_ids = [user_id for user_id, _ in changed]
+                rows = (
+                    db.query(models.User.id, models.User.username, models.User.coins, models.User.streak)
+                    .filter(models.User.id.in_(user_ids))
+                    .all()
+                )
+                for row in rows:
+                    self.update(row.id, row.username, row.coins, row.streak)
+                self._last_ledger_id = max(since, max(last_id for _, last_id in changed))
+            self._caught_up_at = time.monotonic()
+            return len(changed)
+        finally:
+            self._catch_up_lock.release()
+
+    def update(self, user_id: int, username: str, coins: Optional[int], streak: Optional[int]):
+        key = self._key(user_id, coins, streak)
+        with self._lock:
+            previous = self._entries.get(user_id)
+            if previous is not None:
+                if previous[0] == key:
+                    self._entries[user_id] = (key, username)
+                    return
+                self._ranked.remove(previous[0])
+            self._ranked.add(key)
+            self._entries[user_id] = (key, username)
+
+    def remove(self, user_id: int):
+        with self._lock:
+            previous = self._entries.pop(user_id, None)
+            if previous is not None:
+                self._ranked.remove(previous[0])
+
+    def _row(self, rank: int, key) -> dict:
+        neg_coins, neg_streak, user_id = key
+        return {
+            "rank": rank,
+            "username": self._entries[user_id][1],
+            "coins": -neg_coins,
+            "streak": -neg_streak,
+        }
+
+    def top(self, limit: int = 10, offset: int = 0) -> list:
+        with self._lock:
+            keys = self._ranked[offset:offset + limit]
+            return [self._row(offset + i + 1, key) for i, key in enumerate(keys)]
+
+    def rank_of(self, user_id: int) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            row = self._row(self._ranked.index(entry[0]) + 1, entry[0])
+            row["total"] = len(self._ranked)
+            return row
+
+    def __len__(self):
+        return len(self._ranked)
+
+
+board = Leaderboard()
+
+# --- Windowed Leaderboards ---
+# 'day' and 'week' rank coins earned in the current period, read from the rollup
+# tables maintained by coin_service (one indexed range per request).
+
+def _window_table(window: str, today: date):
+    if window == "day":
+        return models.DailyCoinTotal, models.DailyCoinTotal.day, today
+    return models.WeeklyCoinTotal, models.WeeklyCoinTotal.week_start, coin_service.week_start(today)
+
+def windowed_top(db: Session, window: str, limit: int = 10, offset: int = 0, today: Optional[date] = None) -> list:
+    model, period_column, period_value = _window_table(window, today or date.today())
+    rows = (
+        db.query(models.User.username, models.User.streak, model.coins)
+        .join(models.User, models.User.id == model.user_id)
+        .filter(period_column == period_value)
+        .order_by(model.coins.desc(), model.user_id)
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
+    return [
+        {"rank": offset + i + 1, "username": row.username, "coins": row.coins, "streak": row.streak}
+        for i, row in enumerate(rows)
+    ]
+
+def windowed_rank_of(db: Session, window: str, user_id: int, today: Optional[date] = None) -> dict:
+    model, period_column, period_value = _window_table(window, today or date.today())
+    total = db.query(func.count(model.id)).filter(period_column == period_value).scalar()
+    coins = db.query(model.coins).filter(model.user_id == user_id, period_column == period_value).scalar()
+    if coins is None:
+        # Nothing earned yet in this window
+        return {"rank": None, "coins": 0, "total": total}
+
+    ahead = db.query(func.count(model.id)).filter(
+        period_column == period_value,
+        or_(model.coins > coins, and_(model.coins == coins, model.user_id < user_id)),
+    ).scalar()
+    return {"rank": ahead + 1, "coins": coins, "total": total}
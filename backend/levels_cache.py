@@ -0,0 +1,83 @@
+import hashlib
+import threading
+from typing import List, Optional
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session, selectinload
+import database
+import models
+import schemas
+
+# --- Precomputed /levels Payload ---
+# Level content only changes when seed_database runs, so the serialized body is built
+# once (at startup and after every seed) and served as bytes with a strong ETag.
+
+levels_adapter = TypeAdapter(List[schemas.Level])
+level_map_adapter = TypeAdapter(List[schemas.LevelMapEntry])
+
+class CachedPayload:
+    def __init__(self, levels: List[schemas.Level]):
+        self.levels = levels
+        self.body = levels_adapter.dump_json(levels)
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+        self._order_by_id = {level.id: level.order for level in levels}
+        self._id_by_order = {level.order: level.id for level in levels}
+
+    def next_level_id(self, level_id: int) -> Optional[int]:
+        """Id of the level unlocked by completing `level_id`, or None if it is the last (or unknown)."""
+        order = self._order_by_id.get(level_id)
+        if order is None:
+            return None
+        return self._id_by_order.get(order + 1)
+
+    def level_map(self, progress_by_level: dict) -> bytes:
+        """
+        Serializes the cached levels merged with one user's {level_id: (status, score)}.
+        Content was validated when the cache was built, so entries are constructed without re-validation.
+        """
+        entries = []
+        for level in self.levels:
+            status, score = progress_by_level.get(level.id, (None, None))
+            if status is None:
+                # Level 1 is always playable, even before a progress row exists
+                status = "unlocked" if level.order == 1 else "locked"
+            entries.append(schemas.LevelMapEntry.model_construct(**dict(level), status=status, score=score or 0))
+        return level_map_adapter.dump_json(entries)
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """True if an If-None-Match header already names this version."""
+        if not if_none_match:
+            return False
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in candidates or any(tag.removeprefix("W/") == self.etag for tag in candidates)
+
+class LevelsCache:
+    def __init__(self):
+        self._payload: Optional[CachedPayload] = None
+        self._lock = threading.Lock()
+
+    def rebuild(self, db: Session) -> CachedPayload:
+        levels = (
+            db.query(models.Level)
+            .options(selectinload(models.Level.questions))
+            .order_by(models.Level.id)
+            .all()
+        )
+        for level in levels:
+            level.questions.sort(key=lambda q: q.id)
+        payload = CachedPayload(levels_adapter.validate_python(levels, from_attributes=True))
+        with self._lock:
+            self._payload = payload
+        return payload
+
+    def get(self) -> CachedPayload:
+        payload = self._payload
+        if payload is None:
+            db = database.SessionLocal()
+            try:
+                payload = self.rebuild(db)
+            finally:
+                db.close()
+        return payload
+
+
+cache = LevelsCache()
@@ -1,21 +1,39 @@
-from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, Form
+from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, Form, Query, Request, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import select, insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import models
 import schemas
 import database
 import auth
+import hashing
 import ai_service
-from typing import List
+import leaderboard
+import coin_service
+import levels_cache
+import catalog_sync
+import verification_cache
+import proof_index
+import image_pipeline
+import image_quality
+import uploads
+import verification_jobs
+from typing import List, Optional
 from datetime import date, timedelta
 import os
-import time
+import json
+import asyncio
 import email_utils
+import migrations
 from seed_utils import seed_database
 
 # Initialize DB
 models.Base.metadata.create_all(bind=database.engine)
+migrations.run_migrations(database.engine)
 
 app = FastAPI(title="EcoLoop API")
 
@@ -37,6 +55,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    # Multipart bodies are spooled by the framework before the endpoint runs, so reject
+    # oversized uploads from the declared length; uploads.receive enforces the per-type cap.
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        length = request.headers.get("content-length")
+        if length and length.isdigit() and int(length) > uploads.MAX_UPLOAD_REQUEST_BYTES:
+            return JSONResponse(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                content={"detail": f"File too large. Maximum size is {uploads.MAX_UPLOAD_REQUEST_BYTES // uploads.MB} MB."},
+            )
+    return await call_next(request)
+
 # Mount Static Files
 if not os.path.exists("static/image/store"):
     os.makedirs("static/image/store", exist_ok=True)
@@ -48,8 +79,20 @@ def startup_event():
     db = database.SessionLocal()
     try:
         seed_database(db)
+        levels_cache.cache.rebuild(db)
+        leaderboard.board.load(db)
+        proof_index.index.load(db)
     finally:
         db.close()
+    uploads.purge_stale_uploads()
+    ai_service.registry.warm()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    hashing.pool.shutdown()
+    image_pipeline.pipeline.shutdown()
+    await verification_jobs.queue.shutdown()
+    await database.async_engine.dispose()
 
 @app.get("/")
 def root():
@@ -62,12 +105,54 @@ def health_check():
     """
     return {"status": "healthy", "timestamp": str(date.today())}
 
+@app.get("/health/hashing")
+def hashing_stats():
+    """
+    Queue depth and latency of the password hashing pool (used to size HASH_WORKERS / HASH_MAX_PENDING).
+    """
+    return hashing.pool.stats()
+
+@app.get("/health/ai")
+def ai_model_health():
+    """
+    Per-model circuit state, recent quota errors / failures and latency from the AI model router.
+    """
+    return ai_service.router.stats()
+
+@app.get("/health/ai-quota")
+def ai_quota_stats():
+    """
+    Tokens left per model in the shared AI quota, and granted / denied requests per priority class.
+    """
+    return ai_service.quota.stats()
+
+@app.get("/health/images")
+def image_pipeline_stats():
+    """
+    Bytes saved by image preprocessing before model upload, and its process pool's queue and latency.
+    """
+    return image_pipeline.pipeline.stats()
+
+@app.get("/health/jobs")
+def verification_job_stats():
+    """
+    Verification job queue (?async=true uploads): depth, running jobs, rejections and timings.
+    """
+    return verification_jobs.queue.stats()
+
+@app.get("/health/verification-cache")
+def verification_cache_stats():
+    """
+    Hit rate of the content-addressed AI verification cache (memory and database hits).
+    """
+    return verification_cache.cache.stats()
+
 # --- Helpers ---
 
-def update_user_streak(user: models.User, db: Session):
+def update_user_streak(user: models.User):
     """
     Updates the user's streak based on the date of the last action.
-    Should be called ONLY during task completion.
+    Should be called ONLY during task completion. The caller commits.
     """
     today = date.today()
     if user.last_login is None:
@@ -82,31 +167,76 @@ def update_user_streak(user: models.User, db: Session):
     
     # If user.last_login == today, we don't increment multiple times
     user.last_login = today
-    db.commit()
+
+def on_user_changed(user_id: int, username: str, coins: int, streak: int):
+    """
+    Must be called after committing any change to a user's coins, streak or profile,
+    so the per-process auth cache never serves a stale balance and the ranked
+    leaderboard stays current.
+    """
+    auth.user_cache.invalidate(username)
+    leaderboard.board.update(user_id, username, coins, streak)
+
+REUSED_PROOF_MESSAGE = "This photo has already been used as proof. Please take a new photo of your own."
+
+async def proof_image_hash(upload: uploads.ReceivedUpload) -> Optional[int]:
+    """Perceptual hash for reuse detection (images only), computed off the event loop."""
+    if upload.is_video or not upload.data:
+        return None
+    return await asyncio.to_thread(proof_index.image_hash, upload.data)
+
+# --- Verification Jobs (opt-in async mode) ---
+JOB_EVENTS_KEEPALIVE_SECONDS = 15
+
+async def enqueue_job(kind: str, user: auth.CurrentUser, upload: uploads.ReceivedUpload, run) -> JSONResponse:
+    """Queues `run` on the verification workers and answers 202 with the job id."""
+    try:
+        job = await verification_jobs.queue.submit(kind, user.id, run, cleanup=upload.cleanup)
+    except verification_jobs.JobQueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many verifications in progress. Please try again in a few seconds.",
+            headers={"Retry-After": "5"},
+        )
+    # The job owns the upload now; don't let the `receive` block delete it
+    upload.detach()
+    return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={
+        "job_id": job.id,
+        "status": job.status,
+        "poll_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events",
+    })
+
+async def run_with_session(fn, *args):
+    """Runs `fn(db, *args)` in a session of its own, for job workers (the request's is closed)."""
+    async with database.AsyncSessionLocal() as db:
+        return await fn(db, *args)
 
 # --- Authentication Routes ---
 
 @app.post("/register", response_model=schemas.Token)
-def register(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
+async def register(user: schemas.UserCreate, db: AsyncSession = Depends(database.get_async_db)):
     print(f"Registration attempt: {user.username}")
     # Normalize username to lowercase
     user.username = user.username.lower()
 
     # Check if user exists
-    db_user = db.query(models.User).filter(models.User.username == user.username).first()
+    db_user = (await db.execute(select(models.User).where(models.User.username == user.username))).scalars().first()
     if db_user:
         print(f"Registration failed: Username '{user.username}' taken")
         raise HTTPException(status_code=400, detail="Username already registered")
     
-    db_email = db.query(models.User).filter(models.User.email == user.email).first()
+    db_email = (await db.execute(select(models.User).where(models.User.email == user.email))).scalars().first()
     if db_email:
         print(f"Registration failed: Email '{user.email}' taken")
         raise HTTPException(status_code=400, detail="Email already registered")
     
+    # Hash outside the transaction block so a full hashing pool surfaces as 503, not 500
+    print("Hashing password...")
+    hashed_pwd = await auth.get_password_hash_async(user.password)
+
     try:
         # Create User
-        print("Hashing password...")
-        hashed_pwd = auth.get_password_hash(user.password)
         new_user = models.User(
             username=user.username, 
             email=user.email, 
@@ -115,12 +245,12 @@ def register(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
             last_login=None
         )
         db.add(new_user)
-        db.flush() # Get ID without committing yet
+        await db.flush() # Get ID without committing yet
         print(f"User created with ID: {new_user.id}")
         
         # Initialize Progress (Unlock Level 1)
         # Get Level 1 ID
-        level1 = db.query(models.Level).filter(models.Level.order == 1).first()
+        level1 = (await db.execute(select(models.Level).where(models.Level.order == 1))).scalars().first()
         if level1:
             print(f"Unlocking Level 1 for user {new_user.id}")
             new_progress = models.UserProgress(
@@ -131,117 +261,290 @@ def register(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
             )
             db.add(new_progress)
         
-        db.commit()
+        await db.commit()
+        on_user_changed(new_user.id, new_user.username, new_user.coins, new_user.streak)
         print("Registration transaction committed successfully")
         
         # Create Token
         access_token = auth.create_access_token(data={"sub": new_user.username})
         return {"access_token": access_token, "token_type": "bearer"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"CRITICAL ERROR during registration: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
 @app.post("/login", response_model=schemas.Token)
-def login(user_credentials: schemas.UserLogin, db: Session = Depends(database.get_db)):
+async def login(user_credentials: schemas.UserLogin, db: AsyncSession = Depends(database.get_async_db)):
     # Normalize username
     user_credentials.username = user_credentials.username.lower()
     
-    user = db.query(models.User).filter(models.User.username == user_credentials.username).first()
+    user = (await db.execute(select(models.User).where(models.User.username == user_credentials.username))).scalars().first()
     if not user:
         raise HTTPException(status_code=400, detail="Invalid Credentials")
     
-    if not auth.verify_password(user_credentials.password, user.hashed_password):
+    is_valid, new_hash = await auth.verify_and_update_password_async(user_credentials.password, user.hashed_password)
+    if not is_valid:
         raise HTTPException(status_code=400, detail="Invalid Credentials")
+
+    # Transparently upgrade hashes made with outdated Argon2 parameters
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
         
     # Login no longer updates streak to ensure it's task-based
-    # update_user_streak(user, db)
+    # update_user_streak(user)
     
     access_token = auth.create_access_token(data={"sub": user.username})
     return {"access_token": access_token, "token_type": "bearer"}
 
-@app.get("/users/me", response_model=schemas.UserResponse)
-def read_users_me(current_user: models.User = Depends(auth.get_current_user)):
-    return current_user
+# /users/me only embeds recent completions; older ones come from /users/me/challenge-history.
+# 31 days always covers the current month shown by the streak calendar.
+RECENT_COMPLETIONS_DAYS = 31
+RECENT_COMPLETIONS_LIMIT = 200
 
-@app.post("/users/progress")
-def update_progress(
-    progress_data: schemas.ProgressUpdate, 
+@app.get("/users/me", response_model=schemas.UserResponse)
+def read_users_me(db: Session = Depends(database.get_db), current_user: auth.CurrentUser = Depends(auth.get_current_user)):
+    # Constant query count however old the account is: user columns come from the
+    # auth cache, then one progress query and one bounded completions query.
+    progress = db.query(models.UserProgress).filter(
+        models.UserProgress.user_id == current_user.id
+    ).order_by(models.UserProgress.id).all()
+
+    since = date.today() - timedelta(days=RECENT_COMPLETIONS_DAYS)
+    completions = db.query(
+        models.UserChallengeCompletion.challenge_id,
+        models.UserChallengeCompletion.completion_date
+    ).filter(
+        models.UserChallengeCompletion.user_id == current_user.id,
+        models.UserChallengeCompletion.completion_date >= since
+    ).order_by(
+        models.UserChallengeCompletion.completion_date.desc(),
+        models.UserChallengeCompletion.id.desc()
+    ).limit(RECENT_COMPLETIONS_LIMIT).all()
+
+    return schemas.UserResponse(
+        id=current_user.id,
+        username=current_user.username,
+        email=current_user.email,
+        coins=current_user.coins,
+        streak=current_user.streak,
+        profile_image=current_user.profile_image,
+        progress=[schemas.UserProgress.model_validate(p) for p in progress],
+        challenge_completions=[schemas.ChallengeCompletion.model_validate(c) for c in completions],
+    )
+
+@app.get("/users/me/challenge-history", response_model=List[schemas.ChallengeCompletion])
+def read_challenge_history(
+    limit: int = Query(50, ge=1, le=200),
+    offset: int = Query(0, ge=0),
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    current_user: auth.CurrentUser = Depends(auth.get_current_user)
 ):
-    # 1. Update User Coins & Streak
-    current_user.coins += progress_data.coins_earned
-    
-    # Only update streak if it's a level completion (task verified)
-    if progress_data.is_level_completion:
-        update_user_streak(current_user, db)
-        
-    # 2. Check/Update UserProgress for this Level
-    user_progress = db.query(models.UserProgress).filter(
-        models.UserProgress.user_id == current_user.id,
-        models.UserProgress.level_id == progress_data.level_id
-    ).first()
-    
+    # Full completion history, newest first
+    return db.query(
+        models.UserChallengeCompletion.challenge_id,
+        models.UserChallengeCompletion.completion_date
+    ).filter(
+        models.UserChallengeCompletion.user_id == current_user.id
+    ).order_by(
+        models.UserChallengeCompletion.completion_date.desc(),
+        models.UserChallengeCompletion.id.desc()
+    ).offset(offset).limit(limit).all()
+
+def apply_progress_event(db: Session, user_id: int, event: schemas.ProgressUpdate, progress_rows: dict, levels: levels_cache.CachedPayload):
+    """
+    Applies one progress event to the user's UserProgress rows (keyed by level_id) without
+    querying: callers load the rows they need up front. Coins, streak and commit are the caller's.
+    """
+    user_progress = progress_rows.get(event.level_id)
     if user_progress:
         # Only mark completed if this IS a completion event
-        if progress_data.is_level_completion and user_progress.status != "completed":
+        if event.is_level_completion and user_progress.status != "completed":
              user_progress.status = "completed"
-             user_progress.score = max(user_progress.score, progress_data.xp_earned) 
+             user_progress.score = max(user_progress.score, event.xp_earned) 
     else:
         # Create progress entry if it doesn't exist
-        new_status = "completed" if progress_data.is_level_completion else "unlocked"
+        new_status = "completed" if event.is_level_completion else "unlocked"
         user_progress = models.UserProgress(
-            user_id=current_user.id,
-            level_id=progress_data.level_id,
+            user_id=user_id,
+            level_id=event.level_id,
             status=new_status,
-            score=progress_data.xp_earned if progress_data.is_level_completion else 0
+            score=event.xp_earned if event.is_level_completion else 0
         )
         db.add(user_progress)
+        progress_rows[event.level_id] = user_progress
     
-    # 3. Unlock Next Level (ONLY on completion)
+    # Unlock Next Level (ONLY on completion)
+    if event.is_level_completion:
+        next_level_id = levels.next_level_id(event.level_id)
+        if next_level_id is not None:
+            next_progress = progress_rows.get(next_level_id)
+            if not next_progress:
+                next_progress = models.UserProgress(
+                    user_id=user_id,
+                    level_id=next_level_id,
+                    status="unlocked",
+                    score=0
+                )
+                db.add(next_progress)
+                progress_rows[next_level_id] = next_progress
+            elif next_progress.status == "locked":
+                next_progress.status = "unlocked"
+
+@app.post("/users/progress")
+def update_progress(
+    progress_data: schemas.ProgressUpdate, 
+    db: Session = Depends(database.get_db),
+    current_user: auth.CurrentUser = Depends(auth.get_current_user)
+):
+    levels = levels_cache.cache.get()
+
+    # 1. Update User Coins & Streak
+    new_balance = coin_service.grant(db, current_user.id, progress_data.coins_earned, coin_service.REASON_LEVEL)
+    new_streak = current_user.streak
+    
+    # Only update streak if it's a level completion (task verified)
     if progress_data.is_level_completion:
-        current_level = db.query(models.Level).filter(models.Level.id == progress_data.level_id).first()
-        if current_level:
-            next_level = db.query(models.Level).filter(models.Level.order == current_level.order + 1).first()
-            if next_level:
-                # Check if next level progress already exists
-                next_progress = db.query(models.UserProgress).filter(
-                    models.UserProgress.user_id == current_user.id,
-                    models.UserProgress.level_id == next_level.id
-                ).first()
-                
-                if not next_progress:
-                    next_progress = models.UserProgress(
-                        user_id=current_user.id,
-                        level_id=next_level.id,
-                        status="unlocked",
-                        score=0
-                    )
-                    db.add(next_progress)
-                elif next_progress.status == "locked":
-                    next_progress.status = "unlocked"
+        user = current_user.row
+        update_user_streak(user)
+        new_streak = user.streak
+        
+    # 2. Update UserProgress for this level and unlock the next one (one query for both rows)
+    level_ids = {progress_data.level_id, levels.next_level_id(progress_data.level_id)} - {None}
+    progress_rows = {p.level_id: p for p in db.query(models.UserProgress).filter(
+        models.UserProgress.user_id == current_user.id,
+        models.UserProgress.level_id.in_(level_ids)
+    )}
+    apply_progress_event(db, current_user.id, progress_data, progress_rows, levels)
         
     try:
         db.commit()
-        db.refresh(current_user)
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-    return {"message": "Progress Updated", "new_balance": current_user.coins}
+    on_user_changed(current_user.id, current_user.username, new_balance, new_streak)
+
+    return {"message": "Progress Updated", "new_balance": new_balance}
+
+@app.post("/users/progress/batch")
+def update_progress_batch(
+    batch: schemas.ProgressBatch,
+    db: Session = Depends(database.get_db),
+    current_user: auth.CurrentUser = Depends(auth.get_current_user)
+):
+    """
+    Replays progress recorded offline: events are applied in order in a single transaction.
+    Events whose event_id was already applied (in an earlier batch or earlier in this one) are skipped,
+    so a client can safely resend a batch whose response it never received.
+    """
+    levels = levels_cache.cache.get()
+
+    # 1. Drop duplicates: one query for ids applied by earlier batches
+    event_ids = {event.event_id for event in batch.events}
+    seen = set(db.scalars(select(models.ProcessedProgressEvent.event_id).where(
+        models.ProcessedProgressEvent.user_id == current_user.id,
+        models.ProcessedProgressEvent.event_id.in_(event_ids)
+    ))) if event_ids else set()
+    events = []
+    for event in batch.events:
+        if event.event_id not in seen:
+            seen.add(event.event_id)
+            events.append(event)
+
+    if not events:
+        return {"message": "Progress Updated", "applied": 0, "skipped": len(batch.events),
+                "new_balance": current_user.coins, "new_streak": current_user.streak}
+
+    # 2. All of the user's progress rows in one query (one row per level at most)
+    progress_rows = {p.level_id: p for p in db.query(models.UserProgress).filter(
+        models.UserProgress.user_id == current_user.id
+    )}
+    for event in events:
+        apply_progress_event(db, current_user.id, event, progress_rows, levels)
+    db.execute(insert(models.ProcessedProgressEvent), [
+        {"user_id": current_user.id, "event_id": event.event_id} for event in events
+    ])
+
+    # 3. Coins as one balance update; streak once (it only moves once per day)
+    new_balance = coin_service.grant(db, current_user.id, sum(event.coins_earned for event in events), coin_service.REASON_LEVEL)
+    new_streak = current_user.streak
+    if any(event.is_level_completion for event in events):
+        user = current_user.row
+        update_user_streak(user)
+        new_streak = user.streak
+
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent request applied one of these event ids first; nothing from this batch was kept
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Batch overlaps a batch that is still being applied. Retry.")
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    on_user_changed(current_user.id, current_user.username, new_balance, new_streak)
+
+    return {"message": "Progress Updated", "applied": len(events), "skipped": len(batch.events) - len(events),
+            "new_balance": new_balance, "new_streak": new_streak}
 
 # --- Game Routes ---
 
 @app.get("/levels", response_model=List[schemas.Level])
-def get_levels(db: Session = Depends(database.get_db)):
-    return db.query(models.Level).all()
+def get_levels(request: Request):
+    # Prebuilt body (see levels_cache); clients revalidate with If-None-Match
+    payload = levels_cache.cache.get()
+    headers = {"ETag": payload.etag, "Cache-Control": "no-cache"}
+    if payload.matches(request.headers.get("if-none-match")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=payload.body, media_type="application/json", headers=headers)
+
+@app.get("/levels/me", response_model=List[schemas.LevelMapEntry])
+def get_my_level_map(db: Session = Depends(database.get_db), current_user: auth.CurrentUser = Depends(auth.get_current_user)):
+    """
+    The level map for the current user in one round trip: cached level content
+    merged with the user's status and score from a single joined query.
+    """
+    rows = db.query(models.Level.id, models.UserProgress.status, models.UserProgress.score).outerjoin(
+        models.UserProgress,
+        (models.UserProgress.level_id == models.Level.id) & (models.UserProgress.user_id == current_user.id)
+    ).all()
+    progress_by_level = {row.id: (row.status, row.score) for row in rows}
+    return Response(content=levels_cache.cache.get().level_map(progress_by_level), media_type="application/json")
 
 @app.get("/leaderboard")
-def get_leaderboard(db: Session = Depends(database.get_db)):
-    # Return top 10 users by coins, then streak
-    users = db.query(models.User).order_by(models.User.coins.desc(), models.User.streak.desc()).limit(10).all()
-    return [{"username": u.username, "coins": u.coins, "streak": u.streak} for u in users]
+def get_leaderboard(
+    window: str = Query("all", pattern="^(day|week|all)$"),
+    limit: int = Query(10, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(database.get_db)
+):
+    # 'all': users ranked by coin balance, then streak (served from the in-memory leaderboard)
+    # 'day' / 'week': coins earned in the current period (served from the rollup tables)
+    if window != "all":
+        return leaderboard.windowed_top(db, window, limit, offset)
+    leaderboard.board.catch_up(db)
+    return leaderboard.board.top(limit, offset)
+
+@app.get("/leaderboard/me")
+def get_my_rank(
+    window: str = Query("all", pattern="^(day|week|all)$"),
+    db: Session = Depends(database.get_db),
+    current_user: auth.CurrentUser = Depends(auth.get_current_user)
+):
+    if window != "all":
+        entry = leaderboard.windowed_rank_of(db, window, current_user.id)
+        entry.update(username=current_user.username, streak=current_user.streak)
+        return entry
+
+    leaderboard.board.catch_up(db)
+    entry = leaderboard.board.rank_of(current_user.id)
+    if entry is None:
+        # Registered through another process since our board was built
+        leaderboard.board.update(current_user.id, current_user.username, current_user.coins, current_user.streak)
+        entry = leaderboard.board.rank_of(current_user.id)
+    return entry
 
 # ---------------- CHAT ROUTE (Migrated) ----------------
 
@@ -258,69 +561,86 @@ async def chat_with_ecobot(request: schemas.ChatRequest):
 async def verify_task(
     file: UploadFile = File(...), 
     task_label: str = Form("nature conservation"),
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    async_mode: bool = Query(False, alias="async"),
+    current_user: auth.CurrentUser = Depends(auth.get_current_user_async)
 ):
+    """
+    Verifies proof for a task with the AI. With `?async=true` it answers 202 with a job id
+    instead and the result is read from /jobs/{job_id}.
+    """
     print(f"DEBUG: Verifying task for {current_user.username}")
     print(f"DEBUG: Task Label received: {task_label}")
     print(f"DEBUG: Content Type: {file.content_type}")
 
-    # Save file temporarily to handle video processing or large images
-    temp_dir = "temp_uploads"
-    os.makedirs(temp_dir, exist_ok=True)
-    temp_path = os.path.join(temp_dir, f"{current_user.id}_{int(time.time())}_{file.filename}")
-    
-    try:
-        with open(temp_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        result = await ai_service.verify_task_content(temp_path, file.content_type, task_label)
-        return result
-    finally:
-        # Clean up temp file
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+    # Images stay in memory; videos are spooled to disk and removed when the block exits
+    async with uploads.receive(file) as upload:
+        if async_mode:
+            user = current_user.detached()
+            return await enqueue_job("verify", user, upload, lambda: verify_task_proof(upload, task_label, user))
+        return await verify_task_proof(upload, task_label, current_user)
+
+async def verify_task_proof(upload: uploads.ReceivedUpload, task_label: str, current_user: auth.CurrentUser) -> dict:
+    # Reject a photo someone already used as proof before spending an AI call
+    phash = await proof_image_hash(upload)
+    proof_context = f"task:{verification_cache.normalize_label(task_label)}"
+    if await proof_index.index.find_reuse(phash, current_user.id, proof_context):
+        return {"verified": False, "is_valid": False, "message": REUSED_PROOF_MESSAGE, "confidence": 1.0}
+
+    result = await ai_service.verify_task_content(
+        upload.source, upload.content_type, task_label, content_hash=upload.sha256
+    )
+    # Only a real model verdict claims the photo; bypassed (no key / quota) results prove nothing
+    if result.get("is_valid") and not result.get("bypassed"):
+        await proof_index.index.remember(phash, current_user.id, proof_context)
+    return result
 
 # ---------------- IMAGE QUALITY CHECK (Migrated) ----------------
 
 @app.post("/check-image-quality")
 async def check_image_quality(
     file: UploadFile = File(...),
-    current_user: models.User = Depends(auth.get_current_user)
+    current_user: auth.CurrentUser = Depends(auth.get_current_user)
 ):
-    return {"quality_ok": True, "message": "Quality check bypassed (Optimization)"}
+    """
+    Local blur / exposure / resolution check, the same gate verification runs before calling
+    the model. Lets the client ask for a retake without spending an AI request.
+    """
+    async with uploads.receive(file) as upload:
+        if upload.is_video:
+            return {"quality_ok": True, "message": "Quality check is only available for images", "issues": [], "metrics": None}
+        return await image_quality.check(upload.data)
 
 @app.post("/eco-scanner")
 async def eco_scanner(
     file: UploadFile = File(...),
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    async_mode: bool = Query(False, alias="async"),
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.CurrentUser = Depends(auth.get_current_user_async)
 ):
     """
     AI Scanner: Identifies an object, gives eco-advice, and awards coins.
+    With `?async=true` it answers 202 with a job id; coins are awarded when the job finishes.
     """
-    temp_dir = "temp_uploads"
-    os.makedirs(temp_dir, exist_ok=True)
-    temp_path = os.path.join(temp_dir, f"scan_{current_user.id}_{int(time.time())}_{file.filename}")
-    
-    try:
-        with open(temp_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+    async with uploads.receive(file) as upload:
+        if async_mode:
+            user = current_user.detached()
+            return await enqueue_job("scan", user, upload, lambda: run_with_session(scan_eco_object, upload, user))
+        return await scan_eco_object(db, upload, current_user)
+
+async def scan_eco_object(db: AsyncSession, upload: uploads.ReceivedUpload, current_user: auth.CurrentUser) -> dict:
+    result = await ai_service.analyze_eco_object(upload.source, upload.content_type)
+
+    if result.get("quality_ok") is False:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=result["message"])
         
-        result = await ai_service.analyze_eco_object(temp_path, file.content_type)
+    # Award coins if result is valid (throttled fallbacks carry 0 points)
+    if result.get("points"):
+        new_balance = await db.run_sync(coin_service.grant, current_user.id, int(result["points"]), coin_service.REASON_SCAN)
+        await db.commit()
+        on_user_changed(current_user.id, current_user.username, new_balance, current_user.streak)
+        result["new_balance"] = new_balance
         
-        # Award coins if result is valid
-        if "points" in result:
-            current_user.coins += int(result["points"])
-            db.commit()
-            result["new_balance"] = current_user.coins
-            
-        return result
-    finally:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+    return result
 
 
 # --- Store Endpoints ---
@@ -332,15 +652,12 @@ def get_store_items(db: Session = Depends(database.get_db)):
 def purchase_item(
     request: schemas.PurchaseRequest,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    current_user: auth.CurrentUser = Depends(auth.get_current_user)
 ):
     item = db.query(models.StoreItem).filter(models.StoreItem.id == request.item_id).first()
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
     
-    if current_user.coins < item.price:
-        raise HTTPException(status_code=400, detail="Insufficient EcoCoins")
-    
     # Check if already owned 
     already_owned = db.query(models.UserItem).filter(
         models.UserItem.user_id == current_user.id,
@@ -350,40 +667,41 @@ def purchase_item(
     if already_owned:
         raise HTTPException(status_code=400, detail="You already own this item!")
 
-    # Deduct coins
-    current_user.coins -= item.price
+    # Deduct coins (atomically refuses if the balance doesn't cover the price)
+    new_balance = coin_service.spend(db, current_user.id, item.price, coin_service.REASON_PURCHASE)
+    if new_balance is None:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Insufficient EcoCoins")
     
     # Log purchase
     user_item = models.UserItem(user_id=current_user.id, item_id=item.id)
     db.add(user_item)
     db.commit()
+    on_user_changed(current_user.id, current_user.username, new_balance, current_user.streak)
     
-    return {"message": f"Successfully purchased {item.name}!", "new_balance": current_user.coins}
+    return {"message": f"Successfully purchased {item.name}!", "new_balance": new_balance}
 
 # --- Challenge Endpoints ---
 @app.get("/challenges", response_model=List[schemas.ChallengeSchema])
-def get_challenges(db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+def get_challenges(db: Session = Depends(database.get_db), current_user: auth.CurrentUser = Depends(auth.get_current_user)):
     challenges = db.query(models.Challenge).filter(models.Challenge.is_active == True).all()
     
-    # Check completion for current user today
+    # Completion status for all challenges in one query: equality lookups on the
+    # (user_id, challenge_id, period_key) index for today's and this week's keys
     today = date.today()
+    current_keys = {c.id: models.challenge_period_key(c.type, today) for c in challenges}
+    completed = set(db.query(
+        models.UserChallengeCompletion.challenge_id,
+        models.UserChallengeCompletion.period_key
+    ).filter(
+        models.UserChallengeCompletion.user_id == current_user.id,
+        models.UserChallengeCompletion.challenge_id.in_(current_keys.keys()),
+        models.UserChallengeCompletion.period_key.in_(set(current_keys.values()))
+    ).all()) if challenges else set()
+
     results = []
     for c in challenges:
-        is_completed = False
-        if c.type == 'daily':
-            is_completed = db.query(models.UserChallengeCompletion).filter(
-                models.UserChallengeCompletion.user_id == current_user.id,
-                models.UserChallengeCompletion.challenge_id == c.id,
-                models.UserChallengeCompletion.completion_date == today
-            ).first() is not None
-        elif c.type == 'weekly':
-            # Simplified weekly: check if completed in current week (Sun-Sat or Mon-Sun)
-            start_of_week = today - timedelta(days=today.weekday())
-            is_completed = db.query(models.UserChallengeCompletion).filter(
-                models.UserChallengeCompletion.user_id == current_user.id,
-                models.UserChallengeCompletion.challenge_id == c.id,
-                models.UserChallengeCompletion.completion_date >= start_of_week
-            ).first() is not None
+        is_completed = (c.id, current_keys[c.id]) in completed
 
         c_schema = schemas.ChallengeSchema.from_orm(c)
         c_schema.is_completed = is_completed
@@ -395,81 +713,168 @@ def get_challenges(db: Session = Depends(database.get_db), current_user: models.
 async def complete_challenge(
     challenge_id: int,
     file: UploadFile = File(...),
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    async_mode: bool = Query(False, alias="async"),
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.CurrentUser = Depends(auth.get_current_user_async)
 ):
-    challenge = db.query(models.Challenge).filter(models.Challenge.id == challenge_id).first()
+    """
+    Verifies challenge proof and awards its coins (and streak, for daily challenges).
+    With `?async=true` it answers 202 with a job id; the rewards are applied by the job.
+    """
+    challenge, period_key = await open_challenge(db, challenge_id, current_user.id)
+
+    async with uploads.receive(file) as upload:
+        if async_mode:
+            user = current_user.detached()
+            return await enqueue_job("challenge", user, upload, lambda: run_with_session(complete_challenge_job, challenge_id, upload, user))
+        return await verify_challenge_proof(db, challenge, period_key, upload, current_user)
+
+async def open_challenge(db: AsyncSession, challenge_id: int, user_id: int):
+    """The challenge and current period key; 404 / 400 if it is missing or already completed."""
+    challenge = await db.get(models.Challenge, challenge_id)
     if not challenge:
         raise HTTPException(status_code=404, detail="Challenge not found")
     
     today = date.today()
+    period_key = models.challenge_period_key(challenge.type, today)
     
-    # Check if already completed
-    existing = None
-    if challenge.type == 'daily':
-        existing = db.query(models.UserChallengeCompletion).filter(
-            models.UserChallengeCompletion.user_id == current_user.id,
-            models.UserChallengeCompletion.challenge_id == challenge.id,
-            models.UserChallengeCompletion.completion_date == today
-        ).first()
-    else: # weekly
-        start_of_week = today - timedelta(days=today.weekday())
-        existing = db.query(models.UserChallengeCompletion).filter(
-            models.UserChallengeCompletion.user_id == current_user.id,
-            models.UserChallengeCompletion.challenge_id == challenge.id,
-            models.UserChallengeCompletion.completion_date >= start_of_week
-        ).first()
+    # Check if already completed this period (cheap check before spending an AI call)
+    existing = (await db.execute(select(models.UserChallengeCompletion.id).where(
+        models.UserChallengeCompletion.user_id == user_id,
+        models.UserChallengeCompletion.challenge_id == challenge.id,
+        models.UserChallengeCompletion.period_key == period_key
+    ))).first()
 
     if existing:
         raise HTTPException(status_code=400, detail="Challenge already completed!")
+    return challenge, period_key
 
+async def complete_challenge_job(db: AsyncSession, challenge_id: int, upload: uploads.ReceivedUpload, current_user: auth.CurrentUser) -> dict:
+    # Checked again: the period may have rolled over or another submission won while queued
+    challenge, period_key = await open_challenge(db, challenge_id, current_user.id)
+    return await verify_challenge_proof(db, challenge, period_key, upload, current_user)
+
+async def verify_challenge_proof(db: AsyncSession, challenge: models.Challenge, period_key: str, upload: uploads.ReceivedUpload, current_user: auth.CurrentUser) -> dict:
     # --- AI Verification ---
-    temp_dir = "temp_uploads"
-    os.makedirs(temp_dir, exist_ok=True)
-    temp_path = os.path.join(temp_dir, f"challenge_{challenge_id}_{int(time.time())}_{file.filename}")
+    # Reject a photo someone already used as proof before spending an AI call
+    phash = await proof_image_hash(upload)
+    proof_context = f"challenge:{challenge.id}:{period_key}"
+    if await proof_index.index.find_reuse(phash, current_user.id, proof_context):
+        raise HTTPException(status_code=400, detail=f"Verification failed: {REUSED_PROOF_MESSAGE}")
+
+    # Use challenge description to match Level Task verification logic (which uses task_description)
+    label = challenge.description or challenge.title
+    verification = await ai_service.verify_task_content(
+        upload.source, upload.content_type, label, content_hash=upload.sha256
+    )
     
+    if not verification.get("is_valid"):
+         raise HTTPException(status_code=400, detail=f"Verification failed: {verification.get('message')}")
+
+    today = date.today()
+    # Log Completion first: a concurrent duplicate submission fails here on the unique index
+    completion = models.UserChallengeCompletion(
+        user_id=current_user.id,
+        challenge_id=challenge.id,
+        completion_date=today,
+        period_key=period_key
+    )
+    db.add(completion)
     try:
-        with open(temp_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        # Use challenge description to match Level Task verification logic (which uses task_description)
-        label = challenge.description or challenge.title
-        verification = await ai_service.verify_task_content(temp_path, file.content_type, label)
-        
-        if not verification.get("is_valid"):
-             raise HTTPException(status_code=400, detail=f"Verification failed: {verification.get('message')}")
-             
-    finally:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        await db.flush()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Challenge already completed!")
 
     # Reward Coins
-    current_user.coins += challenge.coin_reward
+    new_balance = await db.run_sync(coin_service.grant, current_user.id, challenge.coin_reward, coin_service.REASON_CHALLENGE)
+    new_streak = current_user.streak
     
     streak_incremented = False
     if challenge.type == 'daily':
-        update_user_streak(current_user, db)
+        user = await current_user.load_async(db)
+        update_user_streak(user)
+        new_streak = user.streak
         streak_incremented = True
     
-    # Log Completion
-    completion = models.UserChallengeCompletion(user_id=current_user.id, challenge_id=challenge.id)
-    db.add(completion)
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    on_user_changed(current_user.id, current_user.username, new_balance, new_streak)
+    if not verification.get("bypassed"):
+        await proof_index.index.remember(phash, current_user.id, proof_context)
     
     return {
         "message": f"Challenge '{challenge.title}' Verified & Completed!",
-        "new_balance": current_user.coins,
+        "new_balance": new_balance,
         "streak_incremented": streak_incremented,
-        "new_streak": current_user.streak
+        "new_streak": new_streak
     }
 
+# --- Verification Job Results ---
+async def get_job_or_404(job_id: str, current_user: auth.CurrentUser) -> verification_jobs.Job:
+    job = await verification_jobs.queue.get(job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, current_user: auth.CurrentUser = Depends(auth.get_current_user_async)):
+    """
+    Status of a job queued with `?async=true`. Once 'done', `result` is what the synchronous
+    endpoint would have returned; once 'failed', `error` holds its status code and detail.
+    """
+    return (await get_job_or_404(job_id, current_user)).to_dict()
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(
+    job_id: str,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.CurrentUser = Depends(auth.get_current_user_async)
+):
+    """
+    Server-sent events for a job: one event per status change (named after the status, data
+    as in GET /jobs/{job_id}); the stream ends after 'done' or 'failed'.
+    """
+    job = await get_job_or_404(job_id, current_user)
+    # Don't hold a pooled connection (used by the auth lookup) for the life of the stream
+    await db.close()
+
+    async def stream():
+        sent = None
+        while True:
+            # Compare with what was last sent: the status may change while a yield is pending
+            if job.status != sent:
+                sent = job.status
+                yield f"event: {sent}\ndata: {json.dumps(job.to_dict())}\n\n"
+                if sent in verification_jobs.FINISHED:
+                    return
+            elif not await verification_jobs.queue.wait_for_change(job, JOB_EVENTS_KEEPALIVE_SECONDS):
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no", # let nginx-style proxies pass events through immediately
+    })
+
+# --- Delta Sync ---
+@app.get(
+    "/sync",
+    response_model=schemas.SyncResponse,
+    # Catalog only; per-user completion status stays on /challenges
+    response_model_exclude={"challenges": {"__all__": {"is_completed"}}},
+)
+def sync_catalog(since: int = Query(0, ge=0), db: Session = Depends(database.get_db)):
+    """
+    Levels, store items, challenges and community feed rows changed after version `since`,
+    plus ids removed since then. Call with since=0 first, then pass back the returned version.
+    """
+    return catalog_sync.changes_since(db, since)
+
 # --- Seed Data Endpoint (For Demo) ---
 @app.post("/seed")
 def seed_data(db: Session = Depends(database.get_db)):
     from seed_utils import seed_database
     seed_database(db)
+    levels_cache.cache.rebuild(db)
     seed_full_data(db)
     return {"message": "Database seeded and updated successfully (Levels, Questions, Store, Challenges, Community Feed)."}
 
@@ -550,10 +955,10 @@ def seed_full_data(db: Session = Depends(database.get_db)):
 
 
 @app.post("/contact")
-async def create_ngo_request(request: schemas.NGORequestCreate, db: Session = Depends(database.get_db)):
+async def create_ngo_request(request: schemas.NGORequestCreate, db: AsyncSession = Depends(database.get_async_db)):
     new_request = models.NGORequest(**request.dict())
     db.add(new_request)
-    db.commit()
+    await db.commit()
     
     # Send Email
     try:
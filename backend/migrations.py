@@ -0,0 +1,139 @@
+from datetime import date
+from sqlalchemy import inspect, text, select, update
+from sqlalchemy.engine import Connection
+import models
+import catalog_sync
+
+# --- Schema Migrations ---
+# create_all() only creates missing tables; it never touches tables that already
+# exist in an ecoloop.db. Each step below is idempotent and runs on every startup.
+
+def dedupe_user_progress(conn: Connection):
+    """
+    Collapses duplicate (user_id, level_id) progress rows so the unique index can be built.
+    Keeps the most advanced row: completed > unlocked > locked, then best score, then oldest.
+    """
+    existing = {ix["name"] for ix in inspect(conn).get_indexes("user_progress")}
+    if "uq_user_progress_user_level" in existing:
+        return
+
+    result = conn.execute(text("""
+        DELETE FROM user_progress WHERE id NOT IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY user_id, level_id
+                    ORDER BY CASE status WHEN 'completed' THEN 0 WHEN 'unlocked' THEN 1 ELSE 2 END,
+                             score DESC, id
+                ) AS rn
+                FROM user_progress
+            ) ranked WHERE rn = 1
+        )
+    """))
+    if result.rowcount:
+        print(f"Migration: removed {result.rowcount} duplicate user_progress rows")
+
+def add_missing_columns(conn: Connection):
+    """Adds nullable columns that were introduced after a table was first created."""
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    for table in models.Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {col["name"] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                col_type = column.type.compile(dialect=conn.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}'))
+                print(f"Migration: added column {table.name}.{column.name}")
+
+def backfill_completion_period_keys(conn: Connection):
+    """
+    Fills UserChallengeCompletion.period_key for rows written before the column existed,
+    dropping rows that duplicate an earlier completion of the same period (or have no
+    completion date, so no period at all).
+    """
+    existing = {ix["name"] for ix in inspect(conn).get_indexes("user_challenge_completions")}
+    if "uq_completions_user_challenge_period" in existing:
+        return
+
+    rows = conn.execute(text("""
+        SELECT ucc.id, ucc.user_id, ucc.challenge_id, ucc.completion_date, c.type
+        FROM user_challenge_completions ucc
+        LEFT JOIN challenges c ON c.id = ucc.challenge_id
+        ORDER BY ucc.id
+    """)).fetchall()
+
+    seen = set()
+    updates, duplicates = [], []
+    for row in rows:
+        day = row.completion_date
+        if isinstance(day, str): # SQLite returns plain strings through text()
+            day = date.fromisoformat(day)
+        key = models.challenge_period_key(row.type, day) if day else None
+        if key is None or (row.user_id, row.challenge_id, key) in seen:
+            duplicates.append({"id": row.id})
+            continue
+        seen.add((row.user_id, row.challenge_id, key))
+        updates.append({"id": row.id, "key": key})
+
+    if duplicates:
+        conn.execute(text("DELETE FROM user_challenge_completions WHERE id = :id"), duplicates)
+        print(f"Migration: removed {len(duplicates)} duplicate or undated challenge completions")
+    if updates:
+        conn.execute(text("UPDATE user_challenge_completions SET period_key = :key WHERE id = :id"), updates)
+
+def require_completion_period_keys(conn: Connection):
+    """
+    period_key was added as a nullable column to existing databases, and NULLs never
+    collide in the unique index. Refuse to start with unkeyed rows, and enforce NOT NULL
+    where the database can alter the column in place (SQLite keeps relying on this check).
+    """
+    column = next(c for c in inspect(conn).get_columns("user_challenge_completions") if c["name"] == "period_key")
+    if not column["nullable"]:
+        return
+    missing = conn.execute(text("SELECT COUNT(*) FROM user_challenge_completions WHERE period_key IS NULL")).scalar()
+    if missing:
+        raise RuntimeError(f"Migration: {missing} challenge completions have no period_key")
+    if conn.dialect.name != "sqlite":
+        conn.execute(text("ALTER TABLE user_challenge_completions ALTER COLUMN period_key SET NOT NULL"))
+        print("Migration: user_challenge_completions.period_key is now NOT NULL")
+
+def backfill_catalog_versions(conn: Connection):
+    """Stamps catalog rows created before version columns existed, so delta syncs pick them up."""
+    tables = [model.__table__ for model in catalog_sync.CATALOG_MODELS]
+    pending = [t for t in tables if conn.execute(select(t.c.id).where(t.c.version.is_(None)).limit(1)).first()]
+    if not pending:
+        return
+    version = catalog_sync.next_version(conn)
+    for table in pending:
+        result = conn.execute(update(table).where(table.c.version.is_(None)).values(version=version))
+        print(f"Migration: stamped {result.rowcount} {table.name} rows with catalog version {version}")
+
+# Indexes created by earlier versions that no query uses any more
+RETIRED_INDEXES = [
+    "ix_completions_user_challenge_date", # superseded by uq_completions_user_challenge_period
+]
+
+def drop_retired_indexes(conn: Connection):
+    for index_name in RETIRED_INDEXES:
+        conn.execute(text(f"DROP INDEX IF EXISTS {index_name}"))
+
+def create_missing_indexes(conn: Connection):
+    for table in models.Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+MIGRATIONS = [
+    add_missing_columns,
+    dedupe_user_progress,
+    backfill_completion_period_keys,
+    require_completion_period_keys,
+    backfill_catalog_versions,
+    drop_retired_indexes,
+    create_missing_indexes,
+]
+
+def run_migrations(engine):
+    with engine.begin() as conn:
+        for step in MIGRATIONS:
+            step(conn)
@@ -0,0 +1,187 @@
+import time
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+# --- Circuit-Breaking Model Router ---
+# Tracks the health of each AI model (recent quota errors, other failures, latency) and
+# tries the healthiest model first. A model that hits a quota error, or fails
+# `failure_threshold` times in a row, is skipped ("circuit open") until its cooldown
+# passes; then it is tried again behind healthy models ("half-open"), closing on success
+# and re-opening with a doubled cooldown on failure.
+# Backoff between attempts uses asyncio.sleep so other requests keep being served.
+
+def is_quota_error(error: Exception) -> bool:
+    text = str(error)
+    return "429" in text or "quota" in text.lower() or "resource exhausted" in text.lower()
+
+class AllModelsFailed(Exception):
+    def __init__(self, last_error: Optional[Exception], quota_exhausted: bool, throttled: bool = False):
+        super().__init__(str(last_error) if last_error else "No AI model available")
+        self.last_error = last_error
+        self.quota_exhausted = quota_exhausted
+        self.throttled = throttled # no model was called: `admit` refused every candidate
+
+class ModelHealth:
+    def __init__(self, name: str, priority: int):
+        self.name = name
+        self.priority = priority # position in the configured preference list
+        self.consecutive_failures = 0
+        self.recent_failures = deque() # monotonic timestamps
+        self.recent_quota_errors = deque()
+        self.latency = None # EWMA of successful call time, seconds
+        self.open_until = 0.0
+        self.open_reason = None # 'quota' | 'errors'
+        self.cooldown = 0.0
+        self.successes = 0
+        self.failures = 0
+
+    def state(self, now: float) -> str:
+        if self.open_reason is None:
+            return "closed"
+        return "open" if now < self.open_until else "half_open"
+
+class ModelRouter:
+    STATE_RANK = {"closed": 0, "half_open": 1}
+
+    def __init__(
+        self,
+        model_names: List[str],
+        failure_threshold: int = 3,
+        cooldown_seconds: float = 30.0,
+        quota_cooldown_seconds: float = 60.0,
+        max_cooldown_seconds: float = 600.0,
+        window_seconds: float = 300.0,
+        slow_latency_seconds: float = 15.0,
+        backoff_base_seconds: float = 0.25,
+        backoff_max_seconds: float = 2.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ):
+        self.models = {name: ModelHealth(name, i) for i, name in enumerate(model_names)}
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.quota_cooldown_seconds = quota_cooldown_seconds
+        self.max_cooldown_seconds = max_cooldown_seconds
+        self.window_seconds = window_seconds
+        self.slow_latency_seconds = slow_latency_seconds
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self._clock = clock
+        self._sleep = sleep
+
+    def _prune(self, health: ModelHealth, now: float):
+        for events in (health.recent_failures, health.recent_quota_errors):
+            while events and now - events[0] > self.window_seconds:
+                events.popleft()
+
+    def candidates(self) -> List[str]:
+        """Models worth trying right now, best first. Open circuits are left out."""
+        now = self._clock()
+        ranked = []
+        for health in self.models.values():
+            state = health.state(now)
+            if state == "open":
+                continue
+            self._prune(health, now)
+            slow = health.latency is not None and health.latency > self.slow_latency_seconds
+            ranked.append((
+                self.STATE_RANK[state],
+                len(health.recent_quota_errors),
+                len(health.recent_failures),
+                slow,
+                health.priority,
+                health.name,
+            ))
+        ranked.sort()
+        return [key[-1] for key in ranked]
+
+    def record_success(self, name: str, latency: float):
+        health = self.models[name]
+        health.successes += 1
+        health.consecutive_failures = 0
+        health.open_reason = None
+        health.cooldown = 0.0
+        health.latency = latency if health.latency is None else 0.8 * health.latency + 0.2 * latency
+
+    def record_failure(self, name: str, error: Exception) -> bool:
+        """Returns True if the error was a quota / rate-limit error."""
+        now = self._clock()
+        health = self.models[name]
+        quota = is_quota_error(error)
+        was_half_open = health.state(now) == "half_open"
+        health.failures += 1
+        health.consecutive_failures += 1
+        health.recent_failures.append(now)
+        if quota:
+            health.recent_quota_errors.append(now)
+
+        if quota or was_half_open or health.consecutive_failures >= self.failure_threshold:
+            base = self.quota_cooldown_seconds if quota else self.cooldown_seconds
+            # A failed half-open trial doubles the previous cooldown
+            cooldown = min(health.cooldown * 2, self.max_cooldown_seconds) if was_half_open else base
+            health.cooldown = max(cooldown, base)
+            health.open_until = now + health.cooldown
+            health.open_reason = "quota" if quota else "errors"
+        return quota
+
+    def _backoff(self, attempt: int) -> float:
+        return min(self.backoff_base_seconds * (2 ** (attempt - 1)), self.backoff_max_seconds)
+
+    async def run(self, call: Callable[[str], Awaitable[T]], label: str = "AI", admit: Optional[Callable[[str], bool]] = None) -> T:
+        """
+        Calls `call(model_name)` on the best model first, failing over to the next one.
+        `admit(model_name)`, if given, is asked right before each call (e.g. for quota); a refused
+        model is skipped without counting as a failure.
+        Raises AllModelsFailed if every available model failed or all circuits are open.
+        """
+        last_error = None
+        quota_hit = False
+        refused = 0
+        candidates = self.candidates()
+        attempt = 0
+        for name in candidates:
+            # A concurrent request may have opened this circuit since candidates() ran
+            if attempt and self.models[name].state(self._clock()) == "open":
+                continue
+            if admit is not None and not admit(name):
+                refused += 1
+                continue
+            if attempt:
+                await self._sleep(self._backoff(attempt))
+            attempt += 1
+            start = self._clock()
+            try:
+                result = await call(name)
+            except Exception as e:
+                print(f"⚠️ {label} model {name} failed: {e}")
+                last_error = e
+                quota_hit = self.record_failure(name, e) or quota_hit
+                continue
+            self.record_success(name, self._clock() - start)
+            return result
+
+        if not candidates:
+            # Everything is cooling down; report quota exhaustion if that is why
+            now = self._clock()
+            quota_hit = any(h.open_reason == "quota" for h in self.models.values() if h.state(now) == "open")
+            print(f"⚠️ {label}: all model circuits are open")
+        raise AllModelsFailed(last_error, quota_hit, throttled=attempt == 0 and refused > 0)
+
+    def stats(self) -> dict:
+        now = self._clock()
+        stats = {}
+        for health in self.models.values():
+            self._prune(health, now)
+            stats[health.name] = {
+                "state": health.state(now),
+                "open_for_seconds": round(max(health.open_until - now, 0), 1) if health.open_reason else 0,
+                "recent_quota_errors": len(health.recent_quota_errors),
+                "recent_failures": len(health.recent_failures),
+                "latency_ms": round(health.latency * 1000) if health.latency is not None else None,
+                "successes": health.successes,
+                "failures": health.failures,
+            }
+        return stats
@@ -1,7 +1,7 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Enum, Date
+from sqlalchemy import Column, Integer, String, Boolean, Float, ForeignKey, Enum, Date, DateTime, Index
 from sqlalchemy.orm import relationship
 import enum
-from datetime import date
+from datetime import date, datetime
 from database import Base
 
 # Enum for Level Status
@@ -22,6 +22,11 @@ class User(Base):
     last_login = Column(Date, nullable=True)
     profile_image = Column(String, nullable=True) # Optional avatar URL
 
+    __table_args__ = (
+        # Leaderboard: ORDER BY coins DESC, streak DESC
+        Index("ix_users_coins_streak", coins.desc(), streak.desc()),
+    )
+
     # Relationships
     progress = relationship("UserProgress", back_populates="user")
     owned_items = relationship("UserItem", back_populates="user")
@@ -39,6 +44,7 @@ class Level(Base):
     theme_id = Column(String)   # 'forest', 'river' etc. for frontend map matching
     video_id = Column(String, default="dQw4w9WgXcQ") # YouTube Video ID
     task_description = Column(String, default="Upload a photo proving you completed the eco-task!")
+    version = Column(Integer, default=0, index=True) # catalog_sync stamp; also bumped when its questions change
 
     # Relationships
     user_progress = relationship("UserProgress", back_populates="level")
@@ -54,6 +60,7 @@ class StoreItem(Base):
     icon_type = Column(String) # 'badge', 'hoodie', 'bottle', 'tree'
     category = Column(String, default="Virtual") # 'Symbolic', 'Premium', 'Virtual'
     image_url = Column(String, nullable=True)
+    version = Column(Integer, default=0, index=True) # catalog_sync stamp
 
 class UserItem(Base):
     """Tracks which user has bought which store item"""
@@ -93,10 +100,28 @@ class UserProgress(Base):
     status = Column(String, default="locked") # 'locked', 'unlocked', 'completed'
     score = Column(Integer, default=0) # Quiz score (0-5)
 
+    __table_args__ = (
+        # One progress row per user per level; also serves the (user_id, level_id) lookups
+        Index("uq_user_progress_user_level", "user_id", "level_id", unique=True),
+    )
+
     # Relationships
     user = relationship("User", back_populates="progress")
     level = relationship("Level", back_populates="user_progress")
 
+class ProcessedProgressEvent(Base):
+    """Client event ids already applied by /users/progress/batch, so replayed batches are no-ops"""
+    __tablename__ = "processed_progress_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    event_id = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("uq_progress_events_user_event", "user_id", "event_id", unique=True),
+    )
+
 
 class Challenge(Base):
     __tablename__ = "challenges"
@@ -108,6 +133,17 @@ class Challenge(Base):
     type = Column(String) # 'daily', 'weekly'
     is_active = Column(Boolean, default=True)
     verification_label = Column(String, nullable=True) # AI tag
+    version = Column(Integer, default=0, index=True) # catalog_sync stamp
+
+def challenge_period_key(challenge_type: str, day: date) -> str:
+    """
+    The period a completion counts for: the day ('2026-D290') for daily challenges,
+    otherwise the ISO week ('2026-W42'), matching how completions were always checked.
+    """
+    if challenge_type == "daily":
+        return f"{day.year}-D{day.timetuple().tm_yday:03d}"
+    iso_year, iso_week, _ = day.isocalendar()
+    return f"{iso_year}-W{iso_week:02d}"
 
 class UserChallengeCompletion(Base):
     __tablename__ = "user_challenge_completions"
@@ -116,10 +152,62 @@ class UserChallengeCompletion(Base):
     user_id = Column(Integer, ForeignKey("users.id"))
     challenge_id = Column(Integer, ForeignKey("challenges.id"))
     completion_date = Column(Date, default=date.today)
+    period_key = Column(String, nullable=False) # see challenge_period_key, e.g. '2026-D290' / '2026-W42'
+
+    __table_args__ = (
+        # "Already completed today / this week?" is an equality lookup, and a duplicate
+        # submission for the same period fails on this constraint instead of racing
+        Index("uq_completions_user_challenge_period", "user_id", "challenge_id", "period_key", unique=True),
+        # Recent completions / history for one user, newest first
+        Index("ix_completions_user_date", "user_id", "completion_date"),
+    )
 
     user = relationship("User", back_populates="challenge_completions")
     challenge = relationship("Challenge")
 
+class CoinLedger(Base):
+    """Append-only history of every change to User.coins"""
+    __tablename__ = "coin_ledger"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    delta = Column(Integer) # positive = earned, negative = spent
+    reason = Column(String) # 'level', 'scan', 'challenge', 'purchase'
+    day = Column(Date, default=date.today)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_coin_ledger_user_day", "user_id", "day"),
+    )
+
+class DailyCoinTotal(Base):
+    """Coins earned per user per day, maintained incrementally from the ledger"""
+    __tablename__ = "coin_daily_totals"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    day = Column(Date)
+    coins = Column(Integer, default=0)
+
+    __table_args__ = (
+        Index("uq_coin_daily_totals_user_day", "user_id", "day", unique=True),
+        Index("ix_coin_daily_totals_day_coins", "day", coins.desc()),
+    )
+
+class WeeklyCoinTotal(Base):
+    """Coins earned per user per ISO week (keyed by the Monday), maintained incrementally from the ledger"""
+    __tablename__ = "coin_weekly_totals"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    week_start = Column(Date)
+    coins = Column(Integer, default=0)
+
+    __table_args__ = (
+        Index("uq_coin_weekly_totals_user_week", "user_id", "week_start", unique=True),
+        Index("ix_coin_weekly_totals_week_coins", "week_start", coins.desc()),
+    )
+
 class CommunityFeed(Base):
     __tablename__ = "community_feed"
 
@@ -130,6 +218,60 @@ class CommunityFeed(Base):
     description = Column(String)
     external_link = Column(String)
     created_at = Column(Date, default=date.today)
+    version = Column(Integer, default=0, index=True) # catalog_sync stamp
+
+class SyncState(Base):
+    """Single row holding the last catalog version handed out by catalog_sync"""
+    __tablename__ = "sync_state"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, default=0)
+
+class SyncTombstone(Base):
+    """Records a deleted catalog row so delta-syncing clients can drop it"""
+    __tablename__ = "sync_tombstones"
+
+    id = Column(Integer, primary_key=True, index=True)
+    table_name = Column(String) # 'levels', 'store_items', 'challenges', 'community_feed'
+    row_id = Column(Integer)
+    version = Column(Integer, index=True)
+
+class VerificationResult(Base):
+    """Cached AI verdict for one (uploaded file SHA-256, task label); see verification_cache"""
+    __tablename__ = "verification_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String) # hex SHA-256 of the uploaded bytes
+    label = Column(String) # normalized task label
+    result = Column(String) # JSON verdict as returned by ai_service.verify_task_content
+    expires_at = Column(DateTime, index=True)
+
+    __table_args__ = (
+        Index("uq_verification_cache_hash_label", "content_hash", "label", unique=True),
+    )
+
+class VerificationJob(Base):
+    """State of an `?async=true` verification job, so any API process can answer /jobs/{id}; see verification_jobs"""
+    __tablename__ = "verification_jobs"
+
+    id = Column(String, primary_key=True) # uuid4 hex handed to the client
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    kind = Column(String) # 'verify', 'scan', 'challenge'
+    status = Column(String) # 'queued', 'running', 'done', 'failed'
+    result = Column(String, nullable=True) # JSON response body, once done
+    error = Column(String, nullable=True) # JSON {'status_code', 'detail'}, once failed
+    created_at = Column(Float) # epoch seconds, as reported by the API
+    finished_at = Column(Float, nullable=True, index=True)
+
+class ProofImageHash(Base):
+    """Perceptual hash of an accepted proof photo; loaded into proof_index at startup and on lookups"""
+    __tablename__ = "proof_image_hashes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    phash = Column(String) # 64-bit dHash as 16 hex chars
+    user_id = Column(Integer, ForeignKey("users.id"))
+    context = Column(String) # what it proved, e.g. 'task:plant a tree', 'challenge:3:2026-W42'
+    created_at = Column(DateTime, default=datetime.utcnow)
 
 class NGORequest(Base):
     __tablename__ = "ngo_requests"
@@ -0,0 +1,121 @@
+import time
+import asyncio
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# --- Bounded Process Pool ---
+# Shared by password hashing (hashing.py) and image preprocessing (image_pipeline.py).
+# Each user gets its own pool instance so one workload can't starve the other.
+
+class PoolUnavailable(Exception):
+    """The pool can't take this call right now (callers typically answer 503)."""
+
+
+class PoolFull(PoolUnavailable):
+    """Raised when `max_pending` calls are already queued or running."""
+
+
+class PoolBroken(PoolUnavailable):
+    """Raised when a worker died (e.g. OOM); the pool is rebuilt on the next call."""
+
+
+class BoundedProcessPool:
+    """
+    Runs CPU-heavy top-level functions on a dedicated 'spawn' process pool.
+    At most `max_pending` calls may be queued or running; extra calls are rejected
+    immediately rather than piling up behind a burst.
+    """
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = max(1, workers)
+        self.max_pending = max(self.workers, max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._restarts = 0
+        self._latencies_ms = deque(maxlen=512)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # 'spawn' avoids forking a process that already runs the event loop and DB threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise PoolFull()
+            self._pending += 1
+            executor = self._get_executor()
+
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wrap_future(executor.submit(fn, *args))
+        except BrokenProcessPool:
+            with self._lock:
+                self._pending -= 1
+                self._failed += 1
+                # Only the first caller to notice replaces it; later ones may already see a new pool
+                broken = self._executor is executor
+                if broken:
+                    self._executor = None
+                    self._restarts += 1
+            if broken:
+                print(f"⚠️ {fn.__name__}: process pool worker died; starting a new pool")
+                executor.shutdown(wait=False, cancel_futures=True)
+            raise PoolBroken()
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+                self._failed += 1
+            raise
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._pending -= 1
+            self._completed += 1
+            self._latencies_ms.append(elapsed_ms)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies_ms)
+            pending = self._pending
+            completed = self._completed
+            failed = self._failed
+            rejected = self._rejected
+            restarts = self._restarts
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 1)
+
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "in_flight": min(pending, self.workers),
+            "queue_depth": max(0, pending - self.workers),
+            "completed": completed,
+            "failed": failed,
+            "rejected": rejected,
+            "restarts": restarts,
+            "latency_ms_avg": round(sum(latencies) / len(latencies), 1) if latencies else None,
+            "latency_ms_p50": percentile(0.50),
+            "latency_ms_p95": percentile(0.95),
+        }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
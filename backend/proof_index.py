@@ -0,0 +1,180 @@
+import io
+import os
+import threading
+from datetime import datetime
+from functools import lru_cache
+from itertools import combinations
+from typing import List, Optional, Tuple, Union
+import numpy as np
+from PIL import Image
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+import database
+import models
+
+# --- Reused Proof Photo Detection ---
+# Every accepted proof image is reduced to a 64-bit difference hash (dHash), which stays
+# nearly identical under re-encoding, resizing and small edits. Hashes live in a
+# multi-index hash table so "anything within Hamming distance k?" probes a few buckets
+# instead of scanning every hash. They are persisted in proof_image_hashes and reloaded
+# at startup. A near-duplicate submitted by another user, or for a different task /
+# challenge period, is rejected without an AI call.
+# With several API workers, a lookup that finds no conflict first pulls in the rows other
+# workers have inserted since (one primary-key range query), so a photo accepted through
+# one worker is rejected by all of them.
+
+PROOF_HASH_MAX_DISTANCE = int(os.getenv("PROOF_HASH_MAX_DISTANCE", 6)) # of 64 bits
+HASH_SIZE = 8
+CHUNKS = 4 # multi-index substrings of the 64-bit hash
+CHUNK_BITS = HASH_SIZE * HASH_SIZE // CHUNKS
+MIN_DETAIL_STD = 2.0 # near-uniform images (blank walls, solid colors) carry no identity
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def image_hash(source: Union[str, bytes]) -> Optional[int]:
+    """dHash of an image (file path or bytes), or None if it is too flat to identify (or unreadable)."""
+    try:
+        with Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source) as image:
+            image.draft("L", (HASH_SIZE * 4, HASH_SIZE * 4)) # JPEG: decode at reduced scale
+            pixels = np.asarray(
+                image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS), dtype=np.float32
+            )
+    except Exception:
+        return None
+    if pixels.std() < MIN_DETAIL_STD:
+        return None
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+@lru_cache(maxsize=None)
+def _chunk_masks(radius: int) -> Tuple[int, ...]:
+    """All CHUNK_BITS-bit masks with at most `radius` bits set (0 first)."""
+    masks = [0]
+    for bits in range(1, radius + 1):
+        for positions in combinations(range(CHUNK_BITS), bits):
+            masks.append(sum(1 << p for p in positions))
+    return tuple(masks)
+
+class MultiIndexHash:
+    """
+    Hamming-distance index over 64-bit hashes. Each hash is split into CHUNKS substrings with
+    one dict per position; by pigeonhole, two hashes within distance k differ by at most
+    k // CHUNKS bits in at least one substring, so a lookup probes only those few buckets.
+    """
+    def __init__(self):
+        self._entries = [] # (hash, payload)
+        self._tables = [{} for _ in range(CHUNKS)]
+
+    @staticmethod
+    def _chunks(value: int):
+        mask = (1 << CHUNK_BITS) - 1
+        return [(value >> (i * CHUNK_BITS)) & mask for i in range(CHUNKS)]
+
+    def add(self, value: int, payload):
+        position = len(self._entries)
+        self._entries.append((value, payload))
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            table.setdefault(chunk, []).append(position)
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, object]]:
+        masks = _chunk_masks(max_distance // CHUNKS)
+        candidates = set()
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            for mask in masks:
+                bucket = table.get(chunk ^ mask)
+                if bucket:
+                    candidates.update(bucket)
+        matches = []
+        for position in candidates:
+            other, payload = self._entries[position]
+            distance = hamming(value, other)
+            if distance <= max_distance:
+                matches.append((distance, payload))
+        return sorted(matches, key=lambda match: match[0])
+
+    def __len__(self):
+        return len(self._entries)
+
+class ProofIndex:
+    def __init__(self, max_distance: int):
+        self.max_distance = max_distance
+        self._hashes = MultiIndexHash()
+        self._last_id = 0 # highest proof_image_hashes.id read from the database
+        self._lock = threading.Lock()
+
+    def load(self, db: Session):
+        hashes = MultiIndexHash()
+        last_id = 0
+        for row_id, phash, user_id, context in db.query(
+            models.ProofImageHash.id, models.ProofImageHash.phash,
+            models.ProofImageHash.user_id, models.ProofImageHash.context
+        ).order_by(models.ProofImageHash.id):
+            hashes.add(int(phash, 16), (user_id, context))
+            last_id = row_id
+        with self._lock:
+            self._hashes = hashes
+            self._last_id = last_id
+
+    def _add_if_new(self, phash: int, payload) -> bool:
+        """Adds a hash unless the same (hash, payload) is indexed already. Caller holds the lock."""
+        if any(known == payload for _, known in self._hashes.search(phash, 0)):
+            return False
+        self._hashes.add(phash, payload)
+        return True
+
+    async def catch_up(self) -> int:
+        """Indexes rows inserted since the last load / catch-up (e.g. by other workers)."""
+        with self._lock:
+            since = self._last_id
+        async with database.async_engine.connect() as conn:
+            rows = (await conn.execute(
+                select(models.ProofImageHash.id, models.ProofImageHash.phash,
+                       models.ProofImageHash.user_id, models.ProofImageHash.context)
+                .where(models.ProofImageHash.id > since)
+                .order_by(models.ProofImageHash.id)
+            )).all()
+        added = 0
+        with self._lock:
+            for row_id, phash, user_id, context in rows:
+                added += self._add_if_new(int(phash, 16), (user_id, context))
+                self._last_id = max(self._last_id, row_id)
+        return added
+
+    def _conflict(self, phash: int, user_id: int, context: str) -> Optional[Tuple[int, object]]:
+        with self._lock:
+            matches = self._hashes.search(phash, self.max_distance)
+        for distance, (owner_id, owner_context) in matches:
+            if owner_id != user_id or owner_context != context:
+                return distance, (owner_id, owner_context)
+        return None
+
+    async def find_reuse(self, phash: Optional[int], user_id: int, context: str) -> Optional[Tuple[int, object]]:
+        """
+        Closest earlier acceptance of a near-identical image that this submission may not reuse:
+        anything except the same user proving the same thing again (e.g. a retried upload).
+        """
+        if phash is None:
+            return None
+        conflict = self._conflict(phash, user_id, context)
+        if conflict is None and await self.catch_up():
+            conflict = self._conflict(phash, user_id, context)
+        return conflict
+
+    async def remember(self, phash: Optional[int], user_id: int, context: str):
+        """Indexes an accepted proof image and persists it."""
+        if phash is None:
+            return
+        with self._lock:
+            if not self._add_if_new(phash, (user_id, context)):
+                return # already known
+        async with database.async_engine.begin() as conn:
+            await conn.execute(insert(models.ProofImageHash).values(
+                phash=f"{phash:016x}", user_id=user_id, context=context, created_at=datetime.utcnow()
+            ))
+
+    def __len__(self):
+        return len(self._hashes)
+
+
+index = ProofIndex(PROOF_HASH_MAX_DISTANCE)
@@ -0,0 +1,146 @@
+import time
+import asyncio
+from typing import Awaitable, Callable, Dict, Iterable, Optional, TypeVar
+from model_router import ModelRouter, AllModelsFailed
+
+T = TypeVar("T")
+
+# --- AI Quota Manager ---
+# Chat, task verification and eco-scanning share the same per-model Gemini quota. Each model
+# gets one token bucket (refilled at its requests-per-minute, holding up to a minute's worth)
+# used by every feature, and callers draw from it by priority class: a class may only take a
+# token while at least its reserve (a fraction of the bucket) would be left afterwards.
+# A chat burst therefore stops at the chat reserve, scanning at the smaller scan reserve, and
+# the last tokens stay available to verification. A refused call is skipped by the model
+# router without counting as a model failure; low-priority callers then answer with a canned
+# response instead of queueing, while verification waits up to its max wait for a token.
+# The configured RPM is the budget for the whole deployment: each API process refills its
+# buckets at its share (RPM / processes, where processes defaults to WEB_CONCURRENCY, the
+# worker count uvicorn and gunicorn read), so N workers together never exceed the quota.
+
+PRIORITY_VERIFY = 0
+PRIORITY_SCAN = 1
+PRIORITY_CHAT = 2
+
+PRIORITY_NAMES = {PRIORITY_VERIFY: "verify", PRIORITY_SCAN: "scan", PRIORITY_CHAT: "chat"}
+
+def parse_rpm(spec: str) -> Dict[str, float]:
+    """'models/a=15,models/b=10' -> {'models/a': 15.0, 'models/b': 10.0}"""
+    limits = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, value = item.rsplit("=", 1)
+            limits[name.strip()] = float(value)
+    return limits
+
+class TokenBucket:
+    def __init__(self, requests_per_minute: float, now: float):
+        self.capacity = max(1.0, requests_per_minute)
+        self.rate = requests_per_minute / 60 # tokens per second
+        self.tokens = self.capacity
+        self.updated = now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, reserve: float, now: float) -> bool:
+        """Takes one token if at least `reserve` tokens remain afterwards."""
+        self._refill(now)
+        if self.tokens - 1 < reserve:
+            return False
+        self.tokens -= 1
+        return True
+
+    def seconds_until(self, reserve: float, now: float) -> float:
+        self._refill(now)
+        return max(0.0, (reserve + 1 - self.tokens) / self.rate)
+
+class QuotaManager:
+    def __init__(
+        self,
+        model_names: Iterable[str],
+        default_rpm: float = 15.0,
+        rpm_by_model: Optional[Dict[str, float]] = None,
+        reserves: Optional[Dict[int, float]] = None,
+        max_waits: Optional[Dict[int, float]] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+        processes: int = 1,
+    ):
+        rpm_by_model = rpm_by_model or {}
+        now = clock()
+        # Each of `processes` API processes gets an equal share of every model's RPM
+        self.processes = max(1, processes)
+        self.buckets = {name: TokenBucket(rpm_by_model.get(name, default_rpm) / self.processes, now) for name in model_names}
+        # Fraction of each bucket a class must leave for higher classes
+        self.reserves = reserves or {PRIORITY_VERIFY: 0.0, PRIORITY_SCAN: 0.2, PRIORITY_CHAT: 0.5}
+        # How long a class waits for a token before giving up (chat answers at once)
+        self.max_waits = max_waits or {PRIORITY_VERIFY: 10.0, PRIORITY_SCAN: 2.0, PRIORITY_CHAT: 0.0}
+        self._clock = clock
+        self._sleep = sleep
+        self.granted = {priority: 0 for priority in PRIORITY_NAMES}
+        self.denied = {priority: 0 for priority in PRIORITY_NAMES}
+        self.gave_up = {priority: 0 for priority in PRIORITY_NAMES}
+
+    def _reserve(self, bucket: TokenBucket, priority: int) -> float:
+        return bucket.capacity * self.reserves.get(priority, 0.0)
+
+    def try_acquire(self, model_name: str, priority: int) -> bool:
+        """One request's worth of quota on `model_name` for `priority`, if available right now."""
+        bucket = self.buckets.get(model_name)
+        if bucket is None:
+            return True # not managed
+        if bucket.try_take(self._reserve(bucket, priority), self._clock()):
+            self.granted[priority] += 1
+            return True
+        self.denied[priority] += 1
+        return False
+
+    def seconds_until_available(self, model_names: Iterable[str], priority: int) -> float:
+        """Shortest wait until any of `model_names` has a token for `priority`."""
+        now = self._clock()
+        waits = [bucket.seconds_until(self._reserve(bucket, priority), now)
+                 for bucket in (self.buckets.get(name) for name in model_names) if bucket is not None]
+        return min(waits) if waits else 0.0
+
+    async def run(self, router: ModelRouter, call: Callable[[str], Awaitable[T]], priority: int, label: str = "AI") -> T:
+        """
+        router.run() drawing on this quota. If every model was refused for lack of tokens, waits
+        (up to the class's max wait) for the next token and retries; past that the
+        AllModelsFailed from the router propagates with `throttled` set.
+        """
+        deadline = self._clock() + self.max_waits.get(priority, 0.0)
+        while True:
+            try:
+                return await router.run(call, label=label, admit=lambda name: self.try_acquire(name, priority))
+            except AllModelsFailed as e:
+                remaining = deadline - self._clock()
+                if not e.throttled or remaining <= 0:
+                    if e.throttled:
+                        self.gave_up[priority] += 1
+                        print(f"⚠️ {label}: no AI quota left for '{PRIORITY_NAMES.get(priority, priority)}' requests")
+                    raise
+                wait = self.seconds_until_available(router.candidates(), priority)
+                await self._sleep(min(max(wait, 0.05), remaining))
+
+    def stats(self) -> dict:
+        now = self._clock()
+        models = {}
+        for name, bucket in self.buckets.items():
+            bucket._refill(now)
+            models[name] = {"rpm": round(bucket.rate * 60, 2), "tokens": round(bucket.tokens, 1)}
+        return {
+            "processes": self.processes,
+            "models": models,
+            "classes": {
+                label: {
+                    "reserve": self.reserves.get(priority, 0.0),
+                    "max_wait_seconds": self.max_waits.get(priority, 0.0),
+                    "granted": self.granted[priority],
+                    "denied": self.denied[priority],
+                    "gave_up": self.gave_up[priority],
+                }
+                for priority, label in PRIORITY_NAMES.items()
+            },
+        }
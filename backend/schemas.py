@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
 from datetime import date
 
 # --- Auth Schemas ---
@@ -59,6 +59,11 @@ class Level(LevelBase):
     class Config:
         from_attributes = True
 
+class LevelMapEntry(Level):
+    """A level as seen by one user: static content plus their status and score"""
+    status: str
+    score: int = 0
+
 class UserProgressBase(BaseModel):
     level_id: int
     status: str
@@ -94,6 +99,12 @@ class ProgressUpdate(BaseModel):
     xp_earned: int
     is_level_completion: bool = True
 
+class ProgressEvent(ProgressUpdate):
+    event_id: str = Field(..., min_length=1, max_length=64) # client-generated, unique per user
+
+class ProgressBatch(BaseModel):
+    events: List[ProgressEvent] = Field(..., max_length=500) # applied in list order
+
 # --- Chat Schemas ---
 
 class ChatRequest(BaseModel):
@@ -158,3 +169,14 @@ class NGORequestCreate(BaseModel):
     category: str
     description: str
     website: str
+
+# --- Sync Schemas ---
+
+class SyncResponse(BaseModel):
+    version: int # pass back as ?since= on the next sync
+    full: bool # True: replace the local catalog instead of merging
+    levels: List[Level]
+    store_items: List[StoreItemSchema]
+    challenges: List[ChallengeSchema]
+    community_feed: List[CommunityFeedSchema]
+    deleted: Dict[str, List[int]] # table name -> removed ids
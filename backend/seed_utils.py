@@ -1,5 +1,6 @@
 import models
 import database
+import catalog_sync # registers the flush hook that version-stamps seeded catalog rows
 from sqlalchemy.orm import Session
 from datetime import date, timedelta
 
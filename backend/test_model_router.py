@@ -0,0 +1,189 @@
+"""
+Tests for model_router.ModelRouter against a fake model that simulates quota errors.
+No API key or network access is needed.
+"""
+import asyncio
+import time
+from model_router import ModelRouter, AllModelsFailed, is_quota_error
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+class FakeSleep:
+    """Records backoff delays instead of waiting"""
+    def __init__(self):
+        self.delays = []
+
+    async def __call__(self, seconds: float):
+        self.delays.append(seconds)
+
+class FakeModel:
+    """
+    Stands in for registry.get(name).generate_content_async. `behaviour` maps a model name
+    to 'ok', 'quota' (raises a 429 like the Gemini SDK), 'error', or a latency in seconds.
+    """
+    def __init__(self, behaviour: dict, clock: FakeClock = None):
+        self.behaviour = behaviour
+        self.clock = clock
+        self.calls = []
+
+    async def __call__(self, model_name: str) -> str:
+        self.calls.append(model_name)
+        outcome = self.behaviour.get(model_name, "ok")
+        if outcome == "quota":
+            raise Exception("429 Resource has been exhausted (e.g. check quota).")
+        if outcome == "error":
+            raise Exception("500 Internal error encountered.")
+        if isinstance(outcome, (int, float)) and self.clock:
+            self.clock.advance(outcome)
+        return f"answer from {model_name}"
+
+MODELS = ["models/a", "models/b", "models/c"]
+
+def make_router(**kwargs):
+    clock, sleep = FakeClock(), FakeSleep()
+    router = ModelRouter(MODELS, clock=clock, sleep=sleep, **kwargs)
+    return router, clock, sleep
+
+def test_quota_error_opens_circuit_and_fails_over():
+    router, clock, sleep = make_router(quota_cooldown_seconds=60)
+    model = FakeModel({"models/a": "quota"})
+
+    assert asyncio.run(router.run(model)) == "answer from models/b"
+    assert model.calls == ["models/a", "models/b"]
+    assert router.stats()["models/a"]["state"] == "open"
+
+    # The exhausted model is skipped entirely on the next request, with no backoff
+    model.calls.clear()
+    sleep.delays.clear()
+    assert asyncio.run(router.run(model)) == "answer from models/b"
+    assert model.calls == ["models/b"]
+    assert sleep.delays == []
+
+def test_backoff_grows_between_attempts():
+    router, clock, sleep = make_router(backoff_base_seconds=0.25, backoff_max_seconds=0.4)
+    model = FakeModel({"models/a": "error", "models/b": "error"})
+
+    assert asyncio.run(router.run(model)) == "answer from models/c"
+    assert sleep.delays == [0.25, 0.4]
+
+def test_backoff_does_not_block_event_loop():
+    router = ModelRouter(MODELS, backoff_base_seconds=0.05)
+    model = FakeModel({"models/a": "quota", "models/b": "quota"})
+    ticks = []
+
+    async def ticker():
+        for _ in range(5):
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        result, _ = await asyncio.gather(router.run(model), ticker())
+        return result
+
+    assert asyncio.run(scenario()) == "answer from models/c"
+    # The ticker kept running while the router was backing off
+    assert len(ticks) == 5
+
+def test_half_open_after_cooldown_closes_on_success():
+    router, clock, sleep = make_router(quota_cooldown_seconds=60)
+    model = FakeModel({"models/a": "quota"})
+    asyncio.run(router.run(model))
+
+    clock.advance(61)
+    assert router.stats()["models/a"]["state"] == "half_open"
+    # Half-open models are tried after healthy ones
+    assert router.candidates()[-1] == "models/a"
+
+    model.behaviour = {"models/b": "quota", "models/c": "quota"}
+    model.calls.clear()
+    assert asyncio.run(router.run(model)) == "answer from models/a"
+    assert router.stats()["models/a"]["state"] == "closed"
+
+def test_failed_half_open_trial_doubles_cooldown():
+    router, clock, sleep = make_router(quota_cooldown_seconds=60)
+    model = FakeModel({"models/a": "quota"})
+    asyncio.run(router.run(model))
+
+    clock.advance(61)
+    model.behaviour = {name: "quota" for name in MODELS}
+    try:
+        asyncio.run(router.run(model))
+    except AllModelsFailed:
+        pass
+    assert router.stats()["models/a"]["open_for_seconds"] == 120
+
+def test_consecutive_errors_open_circuit_at_threshold():
+    router, clock, sleep = make_router(failure_threshold=2, cooldown_seconds=30)
+    model = FakeModel({"models/a": "error"})
+
+    asyncio.run(router.run(model))
+    assert router.stats()["models/a"]["state"] == "closed"
+    # A model that just failed is ranked last, so it only gets retried when the others fail too
+    model.behaviour = {name: "error" for name in MODELS}
+    try:
+        asyncio.run(router.run(model))
+    except AllModelsFailed:
+        pass
+    assert router.stats()["models/a"]["state"] == "open"
+    assert router.stats()["models/b"]["state"] == "closed"
+
+def test_all_circuits_open_fails_fast_with_quota_flag():
+    router, clock, sleep = make_router()
+    model = FakeModel({name: "quota" for name in MODELS})
+
+    try:
+        asyncio.run(router.run(model))
+        assert False, "expected AllModelsFailed"
+    except AllModelsFailed as e:
+        assert e.quota_exhausted
+    assert len(model.calls) == 3
+
+    # Every circuit is open: no model is called at all
+    model.calls.clear()
+    try:
+        asyncio.run(router.run(model))
+        assert False, "expected AllModelsFailed"
+    except AllModelsFailed as e:
+        assert e.quota_exhausted
+    assert model.calls == []
+
+def test_recently_failing_and_slow_models_rank_lower():
+    router, clock, sleep = make_router(failure_threshold=5, slow_latency_seconds=10)
+    model = FakeModel({"models/a": "error"}, clock=clock)
+    asyncio.run(router.run(model))
+    assert router.candidates() == ["models/b", "models/c", "models/a"]
+
+    # models/b answers, but very slowly (latency is an EWMA, so one slow call must be far off)
+    model.behaviour = {"models/a": "error", "models/b": 100}
+    asyncio.run(router.run(model))
+    assert router.candidates()[0] == "models/c"
+
+def test_is_quota_error():
+    assert is_quota_error(Exception("429 Too Many Requests"))
+    assert is_quota_error(Exception("Quota exceeded for metric"))
+    assert not is_quota_error(Exception("500 Internal error"))
+
+def test_chat_uses_router_fallback_message_on_quota():
+    import ai_service
+
+    class QuotaModel:
+        async def generate_content_async(self, prompt):
+            raise Exception("429 quota exceeded")
+
+    original_router, original_get = ai_service.router, ai_service.registry.get
+    ai_service.router = ModelRouter(ai_service.models_to_try, sleep=FakeSleep())
+    ai_service.registry.get = lambda model_name, config="default": QuotaModel()
+    try:
+        result = asyncio.run(ai_service.get_chat_response("hello"))
+        assert "Rate Limit Reached" in result["response"]
+        assert all(s["state"] == "open" for s in ai_service.router.stats().values())
+    finally:
+        ai_service.router, ai_service.registry.get = original_router, original_get
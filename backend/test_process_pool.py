@@ -0,0 +1,78 @@
+"""
+Tests for process_pool.BoundedProcessPool recovery and accounting (spawns real worker processes).
+"""
+import os
+import asyncio
+import pytest
+import process_pool
+import hashing
+
+def die():
+    os._exit(1) # what an OOM-killed worker looks like to the parent
+
+def fail():
+    raise ValueError("bad hash")
+
+def double(x):
+    return x * 2
+
+def test_dead_worker_is_replaced():
+    pool = process_pool.BoundedProcessPool(workers=1, max_pending=4)
+
+    async def scenario():
+        with pytest.raises(process_pool.PoolBroken):
+            await pool.run(die)
+        return await pool.run(double, 21)
+
+    try:
+        assert asyncio.run(scenario()) == 42
+        stats = pool.stats()
+        assert stats["restarts"] == 1
+        assert stats["failed"] == 1
+        assert stats["completed"] == 1
+        assert stats["queue_depth"] == 0
+    finally:
+        pool.shutdown()
+
+def test_failed_calls_are_not_counted_as_completed():
+    pool = process_pool.BoundedProcessPool(workers=1, max_pending=4)
+    try:
+        with pytest.raises(ValueError):
+            asyncio.run(pool.run(fail))
+        stats = pool.stats()
+        assert (stats["completed"], stats["failed"], stats["restarts"]) == (0, 1, 0)
+    finally:
+        pool.shutdown()
+
+def test_broken_pool_is_a_503_for_auth():
+    import auth
+
+    async def broken(*args):
+        raise process_pool.PoolBroken()
+
+    original = hashing.pool.run
+    hashing.pool.run = broken
+    try:
+        with pytest.raises(auth.HTTPException) as error:
+            asyncio.run(auth.verify_password_async("pw", "hash"))
+        assert error.value.status_code == 503
+    finally:
+        hashing.pool.run = original
+
+def test_image_fallback_still_runs_quality_gate():
+    import io
+    from PIL import Image
+    import image_pipeline
+
+    class FullPool:
+        async def run(self, fn, *args):
+            raise process_pool.PoolFull()
+
+    tiny = io.BytesIO()
+    Image.new("RGB", (64, 64), (0, 128, 0)).save(tiny, "JPEG")
+    pipeline = image_pipeline.ImagePipeline(workers=1, max_pending=1)
+    pipeline.pool = FullPool()
+    blob, report = asyncio.run(pipeline.prepare_checked(tiny.getvalue(), "image/jpeg"))
+    assert blob is None
+    assert "too_small" in report["issues"]
+    assert pipeline.fallbacks == 1 and pipeline.rejected == 1
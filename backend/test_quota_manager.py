@@ -0,0 +1,149 @@
+"""
+Tests for quota_manager.QuotaManager and its use by the model router and ai_service.
+No API key or network access is needed.
+"""
+import asyncio
+from contextlib import contextmanager
+from model_router import ModelRouter, AllModelsFailed
+from quota_manager import QuotaManager, parse_rpm, PRIORITY_VERIFY, PRIORITY_SCAN, PRIORITY_CHAT
+from test_model_router import FakeClock, FakeSleep, FakeModel, MODELS
+
+class AdvancingSleep:
+    """Moves the fake clock forward instead of waiting"""
+    def __init__(self, clock: FakeClock):
+        self.clock = clock
+        self.delays = []
+
+    async def __call__(self, seconds: float):
+        self.delays.append(seconds)
+        self.clock.advance(seconds)
+
+def make_quota(rpm=10, **kwargs):
+    clock = FakeClock()
+    sleep = AdvancingSleep(clock)
+    quota = QuotaManager(MODELS, default_rpm=rpm, clock=clock, sleep=sleep, **kwargs)
+    router = ModelRouter(MODELS, clock=clock, sleep=FakeSleep())
+    return quota, router, clock, sleep
+
+def drain(quota, model, priority):
+    granted = 0
+    while quota.try_acquire(model, priority):
+        granted += 1
+    return granted
+
+def test_chat_burst_leaves_reserve_for_scan_and_verify():
+    quota, _, _, _ = make_quota(rpm=10)
+    # Chat stops at its 50% reserve, scanning at 20%, verification takes the rest
+    assert drain(quota, "models/a", PRIORITY_CHAT) == 5
+    assert drain(quota, "models/a", PRIORITY_SCAN) == 3
+    assert drain(quota, "models/a", PRIORITY_VERIFY) == 2
+    assert quota.stats()["classes"]["chat"]["denied"] == 1
+
+def test_bucket_refills_at_rpm():
+    quota, _, clock, _ = make_quota(rpm=60)
+    drain(quota, "models/a", PRIORITY_VERIFY)
+    assert not quota.try_acquire("models/a", PRIORITY_VERIFY)
+    clock.advance(1) # 60 rpm = one token per second
+    assert quota.try_acquire("models/a", PRIORITY_VERIFY)
+    assert not quota.try_acquire("models/a", PRIORITY_VERIFY)
+
+def test_refused_model_is_skipped_without_failure():
+    quota, router, _, _ = make_quota(rpm=10)
+    drain(quota, "models/a", PRIORITY_CHAT)
+    model = FakeModel({})
+
+    assert asyncio.run(quota.run(router, model, PRIORITY_CHAT)) == "answer from models/b"
+    assert model.calls == ["models/b"]
+    # Running out of local quota says nothing about the model's health
+    assert router.stats()["models/a"]["failures"] == 0
+    assert router.stats()["models/a"]["state"] == "closed"
+
+def test_chat_gives_up_immediately_when_throttled():
+    quota, router, _, sleep = make_quota(rpm=10)
+    for name in MODELS:
+        drain(quota, name, PRIORITY_CHAT)
+    model = FakeModel({})
+
+    try:
+        asyncio.run(quota.run(router, model, PRIORITY_CHAT))
+        assert False, "expected AllModelsFailed"
+    except AllModelsFailed as e:
+        assert e.throttled and not e.quota_exhausted
+    assert model.calls == []
+    assert sleep.delays == []
+
+def test_verification_waits_for_next_token():
+    quota, router, _, sleep = make_quota(rpm=60)
+    for name in MODELS:
+        drain(quota, name, PRIORITY_VERIFY)
+    model = FakeModel({})
+
+    assert asyncio.run(quota.run(router, model, PRIORITY_VERIFY)) == "answer from models/a"
+    assert len(sleep.delays) == 1 and sleep.delays[0] <= 1.0
+
+def test_verification_gives_up_after_max_wait():
+    quota, router, _, sleep = make_quota(rpm=1, max_waits={PRIORITY_VERIFY: 5.0})
+    for name in MODELS:
+        drain(quota, name, PRIORITY_VERIFY)
+
+    try:
+        asyncio.run(quota.run(router, FakeModel({}), PRIORITY_VERIFY))
+        assert False, "expected AllModelsFailed"
+    except AllModelsFailed as e:
+        assert e.throttled
+    assert sum(sleep.delays) == 5.0
+    assert quota.stats()["classes"]["verify"]["gave_up"] == 1
+
+def test_rpm_is_split_across_processes():
+    quota, _, clock, _ = make_quota(rpm=60, processes=4)
+    # Each process refills at a quarter of the deployment's 60 rpm
+    assert drain(quota, "models/a", PRIORITY_VERIFY) == 15
+    clock.advance(4)
+    assert quota.try_acquire("models/a", PRIORITY_VERIFY)
+    assert not quota.try_acquire("models/a", PRIORITY_VERIFY)
+    assert quota.stats()["models"]["models/a"]["rpm"] == 15
+
+def test_parse_rpm():
+    assert parse_rpm("models/a=15, models/b=7.5") == {"models/a": 15.0, "models/b": 7.5}
+    assert parse_rpm("") == {}
+
+class NeverCalled:
+    async def generate_content_async(self, parts):
+        raise AssertionError("model must not be called without quota")
+
+@contextmanager
+def starved_ai_service(priority):
+    """ai_service with a fake key and every model's budget drained for `priority`"""
+    import ai_service
+
+    original = (ai_service.GOOGLE_API_KEY, ai_service.quota, ai_service.registry.get, ai_service.image_pipeline.pipeline.prepare_checked)
+    clock = FakeClock()
+    quota = QuotaManager(ai_service.models_to_try, default_rpm=1, max_waits={priority: 0.0},
+                         clock=clock, sleep=AdvancingSleep(clock))
+    for name in ai_service.models_to_try:
+        drain(quota, name, priority)
+
+    async def prepare_checked(source, mime_type):
+        return {"mime_type": mime_type, "data": source}, {"quality_ok": True}
+
+    ai_service.GOOGLE_API_KEY = "test"
+    ai_service.quota = quota
+    ai_service.registry.get = lambda model_name, config="default": NeverCalled()
+    ai_service.image_pipeline.pipeline.prepare_checked = prepare_checked
+    try:
+        yield ai_service
+    finally:
+        (ai_service.GOOGLE_API_KEY, ai_service.quota, ai_service.registry.get,
+         ai_service.image_pipeline.pipeline.prepare_checked) = original
+
+def test_throttled_verification_does_not_bypass():
+    with starved_ai_service(PRIORITY_VERIFY) as ai_service:
+        result = asyncio.run(ai_service.verify_task_content(b"jpeg", "image/jpeg", "recycling"))
+        assert result["is_valid"] is False
+        assert "busy" in result["message"]
+
+def test_throttled_scan_awards_no_points():
+    with starved_ai_service(PRIORITY_SCAN) as ai_service:
+        result = asyncio.run(ai_service.analyze_eco_object(b"jpeg", "image/jpeg"))
+        assert result["object_name"] == "Slightly Overwhelmed AI"
+        assert result["points"] == 0
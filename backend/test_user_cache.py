@@ -0,0 +1,40 @@
+"""
+Tests for auth.UserCache invalidation ordering.
+"""
+from types import SimpleNamespace
+from auth import UserCache, CACHED_USER_FIELDS
+
+def user(username="alice", coins=0):
+    fields = {field: None for field in CACHED_USER_FIELDS}
+    fields.update(id=1, username=username, coins=coins)
+    return SimpleNamespace(**fields)
+
+def test_put_then_get():
+    cache = UserCache(ttl_seconds=60, max_size=10)
+    cache.put(user(coins=5), cache.generation())
+    assert cache.get("alice")["coins"] == 5
+
+def test_row_read_before_invalidate_is_not_cached():
+    cache = UserCache(ttl_seconds=60, max_size=10)
+    read_generation = cache.generation()   # reader starts its query
+    cache.invalidate("alice")              # a writer commits and invalidates
+    snapshot = cache.put(user(coins=5), read_generation)  # reader finishes with the old row
+    assert snapshot["coins"] == 5
+    assert cache.get("alice") is None
+
+def test_other_users_invalidation_does_not_block_put():
+    cache = UserCache(ttl_seconds=60, max_size=10)
+    read_generation = cache.generation()
+    cache.invalidate("bob")
+    cache.put(user(coins=5), read_generation)
+    assert cache.get("alice")["coins"] == 5
+
+def test_evicted_invalidation_still_blocks_older_reads():
+    cache = UserCache(ttl_seconds=60, max_size=2)
+    read_generation = cache.generation()
+    for name in ("alice", "bob", "carol"):  # alice's marker is evicted
+        cache.invalidate(name)
+    cache.put(user(coins=5), read_generation)
+    assert cache.get("alice") is None
+    cache.put(user(coins=7), cache.generation())
+    assert cache.get("alice")["coins"] == 7
@@ -0,0 +1,123 @@
+import os
+import time
+import asyncio
+import hashlib
+import tempfile
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import HTTPException, UploadFile, status
+
+# --- Streaming Upload Handling ---
+# Proof uploads are read in chunks with a size cap and hashed (SHA-256) as they stream.
+# Images stay in memory and go to the AI layer as bytes; only videos are spooled to disk
+# (the Gemini File API needs a path), and those files are removed when the request ends,
+# whether it succeeded or not.
+
+MB = 1024 * 1024
+MAX_IMAGE_UPLOAD_BYTES = int(float(os.getenv("MAX_IMAGE_UPLOAD_MB", 15)) * MB)
+MAX_VIDEO_UPLOAD_BYTES = int(float(os.getenv("MAX_VIDEO_UPLOAD_MB", 100)) * MB)
+UPLOAD_CHUNK_BYTES = 256 * 1024
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR", "temp_uploads")
+STALE_UPLOAD_SECONDS = 3600
+
+# Largest request body accepted on upload routes (multipart overhead included)
+MAX_UPLOAD_REQUEST_BYTES = max(MAX_IMAGE_UPLOAD_BYTES, MAX_VIDEO_UPLOAD_BYTES) + MB
+
+class ReceivedUpload:
+    def __init__(self, filename: Optional[str], content_type: Optional[str]):
+        self.filename = filename
+        self.content_type = content_type or "application/octet-stream"
+        self.size = 0
+        self.sha256 = None # hex digest, set once the upload is fully read
+        self.data = None # bytes, for images
+        self.path = None # spooled file, for videos
+        self.detached = False
+
+    @property
+    def is_video(self) -> bool:
+        return self.content_type.startswith("video/")
+
+    @property
+    def source(self):
+        """What the AI layer takes: in-memory bytes, or a file path for videos."""
+        return self.path if self.is_video else self.data
+
+    def detach(self):
+        """Keeps the spooled file after the `receive` block; the new owner must call cleanup()."""
+        self.detached = True
+
+    def cleanup(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+        self.path = None
+
+def _too_large(limit: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File too large. Maximum size is {limit // MB} MB.",
+    )
+
+@asynccontextmanager
+async def receive(file: UploadFile):
+    """
+    Reads `file` chunk by chunk, enforcing the size limit for its type and hashing as it goes.
+    Use as `async with uploads.receive(file) as upload:`; any spooled file is deleted on exit
+    unless the upload was detach()ed (e.g. handed to a verification job).
+    """
+    upload = ReceivedUpload(file.filename, file.content_type)
+    limit = MAX_VIDEO_UPLOAD_BYTES if upload.is_video else MAX_IMAGE_UPLOAD_BYTES
+    if file.size is not None and file.size > limit:
+        raise _too_large(limit)
+
+    digest = hashlib.sha256()
+    spool = None
+    buffer = bytearray()
+    try:
+        if upload.is_video:
+            os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+            fd, upload.path = tempfile.mkstemp(dir=UPLOAD_TMP_DIR, suffix=os.path.splitext(file.filename or "")[1])
+            spool = os.fdopen(fd, "wb")
+
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            upload.size += len(chunk)
+            if upload.size > limit:
+                raise _too_large(limit)
+            digest.update(chunk)
+            if spool is not None:
+                await asyncio.to_thread(spool.write, chunk)
+            else:
+                buffer.extend(chunk)
+
+        if spool is not None:
+            spool.close()
+            spool = None
+        else:
+            upload.data = bytes(buffer)
+        upload.sha256 = digest.hexdigest()
+        yield upload
+    finally:
+        if spool is not None:
+            spool.close()
+        if not upload.detached:
+            upload.cleanup()
+
+def purge_stale_uploads(max_age_seconds: float = STALE_UPLOAD_SECONDS) -> int:
+    """Deletes files left in UPLOAD_TMP_DIR by crashed or killed workers."""
+    if not os.path.isdir(UPLOAD_TMP_DIR):
+        return 0
+    cutoff = time.time() - max_age_seconds
+    removed = 0
+    for name in os.listdir(UPLOAD_TMP_DIR):
+        path = os.path.join(UPLOAD_TMP_DIR, name)
+        try:
+            if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass # removed concurrently by another worker
+    if removed:
+        print(f"Removed {removed} stale files from {UPLOAD_TMP_DIR}")
+    return removed
@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import delete, select
+import database
+import models
+
+# --- Content-Addressed Verification Cache ---
+# AI verdicts keyed by (SHA-256 of the uploaded bytes, task label), so re-submitting the
+# same photo (e.g. after a network hiccup) is answered without another model call.
+# A per-process LRU answers repeats in microseconds; the verification_cache table keeps
+# verdicts across restarts and shares them between workers. Only verdicts that came back
+# from a model are stored, never quota-bypass or error fallbacks.
+
+VERIFICATION_CACHE_TTL_SECONDS = float(os.getenv("VERIFICATION_CACHE_TTL_SECONDS", 24 * 3600))
+VERIFICATION_CACHE_MEMORY_SIZE = int(os.getenv("VERIFICATION_CACHE_MEMORY_SIZE", 2048))
+PURGE_EVERY_STORES = 200
+
+def normalize_label(label: str) -> str:
+    return " ".join((label or "").lower().split())
+
+class VerificationCache:
+    def __init__(self, ttl_seconds: float, memory_size: int):
+        self.ttl_seconds = ttl_seconds
+        self.memory_size = memory_size
+        self._memory = OrderedDict() # (hash, label) -> (monotonic expiry, result)
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    def _remember(self, key, result: dict, ttl: float):
+        with self._lock:
+            self._memory[key] = (time.monotonic() + ttl, result)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _from_memory(self, key) -> Optional[dict]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            expires_at, result = entry
+            if expires_at < time.monotonic():
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return result
+
+    async def get(self, content_hash: str, label: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        key = (content_hash, normalize_label(label))
+        result = self._from_memory(key)
+        if result is not None:
+            self.memory_hits += 1
+            return dict(result)
+
+        now = datetime.utcnow()
+        async with database.async_engine.connect() as conn:
+            row = (await conn.execute(
+                select(models.VerificationResult.result, models.VerificationResult.expires_at).where(
+                    models.VerificationResult.content_hash == key[0],
+                    models.VerificationResult.label == key[1],
+                    models.VerificationResult.expires_at > now,
+                )
+            )).first()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.db_hits += 1
+        result = json.loads(row.result)
+        self._remember(key, result, (row.expires_at - now).total_seconds())
+        return dict(result)
+
+    async def put(self, content_hash: str, label: str, result: dict):
+        if not self.enabled:
+            return
+        key = (content_hash, normalize_label(label))
+        self._remember(key, dict(result), self.ttl_seconds)
+
+        values = {
+            "content_hash": key[0],
+            "label": key[1],
+            "result": json.dumps(result),
+            "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl_seconds),
+        }
+        async with database.async_engine.begin() as conn:
+            stmt = database.upsert_statement(
+                conn.dialect.name, models.VerificationResult, values,
+                index_elements=["content_hash", "label"],
+                set_={"result": values["result"], "expires_at": values["expires_at"]},
+            )
+            if stmt is not None:
+                await conn.execute(stmt)
+            else:
+                # Generic fallback for other backends
+                await conn.execute(delete(models.VerificationResult).where(
+                    models.VerificationResult.content_hash == key[0],
+                    models.VerificationResult.label == key[1],
+                ))
+                await conn.execute(models.VerificationResult.__table__.insert().values(**values))
+            self.stores += 1
+            if self.stores % PURGE_EVERY_STORES == 0:
+                await conn.execute(delete(models.VerificationResult).where(
+                    models.VerificationResult.expires_at <= datetime.utcnow()
+                ))
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.db_hits
+        lookups = hits + self.misses
+        return {
+            "lookups": lookups,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else None,
+            "stores": self.stores,
+            "memory_entries": len(self._memory),
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+cache = VerificationCache(VERIFICATION_CACHE_TTL_SECONDS, VERIFICATION_CACHE_MEMORY_SIZE)
@@ -0,0 +1,307 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+from fastapi import HTTPException
+from sqlalchemy import and_, delete, insert, or_, select, update
+import database
+import models
+
+# --- Verification Job Queue ---
+# Opt-in asynchronous mode for the AI endpoints (`?async=true`). The request reads and checks
+# the upload, queues a job and answers 202 with its id straight away; a fixed set of worker
+# tasks runs the queued jobs (AI call plus coin / streak awards), so at most
+# VERIFICATION_WORKERS verifications are in flight. With VERIFICATION_MAX_PENDING jobs waiting,
+# new submissions are refused with 503 instead of piling up.
+# Finished jobs are kept for VERIFICATION_JOB_TTL_SECONDS and read through GET /jobs/{id} or
+# its server-sent events stream. Every status change is also written to models.VerificationJob,
+# so those reads work on any API process; a stream for a job running elsewhere polls the row
+# every VERIFICATION_JOB_POLL_SECONDS.
+
+VERIFICATION_WORKERS = int(os.getenv("VERIFICATION_WORKERS", 4))
+VERIFICATION_MAX_PENDING = int(os.getenv("VERIFICATION_MAX_PENDING", 100))
+VERIFICATION_JOB_TTL_SECONDS = float(os.getenv("VERIFICATION_JOB_TTL_SECONDS", 600))
+VERIFICATION_JOB_POLL_SECONDS = float(os.getenv("VERIFICATION_JOB_POLL_SECONDS", 1.0))
+PURGE_EVERY_WRITES = 100 # delete expired job rows every N writes
+
+FINISHED = ("done", "failed")
+
+class JobQueueFull(Exception):
+    """Raised when VERIFICATION_MAX_PENDING jobs are already waiting."""
+
+class Job:
+    def __init__(self, kind: str, user_id: int, run: Optional[Callable[[], Awaitable[dict]]], cleanup: Optional[Callable[[], None]], job_id: Optional[str] = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind # 'verify' | 'scan' | 'challenge'
+        self.user_id = user_id
+        self.status = "queued" # -> 'running' -> 'done' | 'failed'
+        self.result = None # the endpoint's response body, once done
+        self.error = None # {'status_code', 'detail'} of the HTTPException it raised, once failed
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._run = run
+        self._cleanup = cleanup
+        self._changed = asyncio.Event()
+        self._stored = False # row inserted into verification_jobs
+        self._save_lock = asyncio.Lock() # keeps this job's writes in order
+
+    @classmethod
+    def from_row(cls, row) -> "Job":
+        """A read-only copy of a job stored by (possibly) another API process."""
+        job = cls(row.kind, row.user_id, None, None, job_id=row.id)
+        job._copy_state(row.status, json.loads(row.result) if row.result else None,
+                        json.loads(row.error) if row.error else None, row.finished_at)
+        job.created_at = row.created_at
+        job._stored = True
+        return job
+
+    def _copy_state(self, status: str, result, error, finished_at):
+        self.result = result
+        self.error = error
+        self.finished_at = finished_at
+        self._set_status(status)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def _set_status(self, status: str):
+        self.status = status
+        # Wake everyone waiting on the old event; later waiters get a fresh one
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait_for_change(self, timeout: float) -> bool:
+        """Waits for the next status change. Returns False if `timeout` passed first."""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+    def to_row(self) -> dict:
+        return {
+            "status": self.status,
+            "result": json.dumps(self.result) if self.result is not None else None,
+            "error": json.dumps(self.error) if self.error is not None else None,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+class JobQueue:
+    def __init__(self, workers: int, max_pending: int, ttl_seconds: float):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.ttl_seconds = ttl_seconds
+        self.jobs: Dict[str, Job] = {}
+        self._queue = None
+        self._tasks = []
+        self._loop = None
+        self._running = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.db_writes = 0
+        self._wait_ms = deque(maxlen=1000) # queued -> running
+        self._run_ms = deque(maxlen=1000) # running -> finished
+
+    def _start(self):
+        # Workers live on the serving event loop, so they are started by the first submission
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def submit(self, kind: str, user_id: int, run: Callable[[], Awaitable[dict]], cleanup: Optional[Callable[[], None]] = None) -> Job:
+        """
+        Queues `run` (an async callable returning the response body). `cleanup` is called once
+        the job has finished, e.g. to delete its spooled upload. Raises JobQueueFull.
+        """
+        self._start()
+        self._prune()
+        job = Job(kind, user_id, run, cleanup)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise JobQueueFull()
+        self.jobs[job.id] = job
+        self.submitted += 1
+        await self._save(job)
+        return job
+
+    async def get(self, job_id: str, user_id: int) -> Optional[Job]:
+        """The job, if it exists and belongs to `user_id`, whichever API process accepted it."""
+        job = self.jobs.get(job_id)
+        if job is None:
+            job = await self._load(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    async def wait_for_change(self, job: Job, timeout: float) -> bool:
+        """
+        Job.wait_for_change for a job from get(). Jobs held by another API process are
+        polled from the database. Returns False if `timeout` passed first.
+        """
+        if self.jobs.get(job.id) is job:
+            return await job.wait_for_change(timeout)
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(min(VERIFICATION_JOB_POLL_SECONDS, remaining))
+            stored = await self._load(job.id)
+            if stored is not None and stored.status != job.status:
+                job._copy_state(stored.status, stored.result, stored.error, stored.finished_at)
+                return True
+
+    # --- Persistence ---
+    async def _save(self, job: Job):
+        """
+        Writes the job's current state for the other API processes. Best effort: if the
+        database is unavailable the job still runs and is served by this process.
+        """
+        async with job._save_lock:
+            values = job.to_row()
+            inserted = False
+            try:
+                async with database.async_engine.begin() as conn:
+                    if job._stored:
+                        await conn.execute(update(models.VerificationJob).where(models.VerificationJob.id == job.id).values(**values))
+                    else:
+                        await conn.execute(insert(models.VerificationJob).values(id=job.id, user_id=job.user_id, kind=job.kind, **values))
+                        inserted = True
+                    self.db_writes += 1
+                    if self.db_writes % PURGE_EVERY_WRITES == 0:
+                        cutoff = time.time() - self.ttl_seconds
+                        await conn.execute(delete(models.VerificationJob).where(or_(
+                            models.VerificationJob.finished_at < cutoff,
+                            # never finished: the process running it went away
+                            and_(models.VerificationJob.finished_at.is_(None), models.VerificationJob.created_at < cutoff - self.ttl_seconds),
+                        )))
+            except Exception as e:
+                inserted = False
+                print(f"⚠️ Could not store verification job {job.id}: {e.__class__.__name__}: {e}")
+            if inserted:
+                job._stored = True
+
+    async def _load(self, job_id: str) -> Optional[Job]:
+        cutoff = time.time() - self.ttl_seconds
+        try:
+            async with database.async_engine.connect() as conn:
+                row = (await conn.execute(
+                    select(models.VerificationJob).where(
+                        models.VerificationJob.id == job_id,
+                        or_(models.VerificationJob.finished_at.is_(None), models.VerificationJob.finished_at >= cutoff),
+                    )
+                )).first()
+        except Exception as e:
+            print(f"⚠️ Could not read verification job {job_id}: {e.__class__.__name__}: {e}")
+            return None
+        return Job.from_row(row) if row is not None else None
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._execute(job)
+            finally:
+                self._queue.task_done()
+
+    async def _execute(self, job: Job):
+        job.started_at = time.time()
+        self._wait_ms.append((job.started_at - job.created_at) * 1000)
+        self._running += 1
+        job._set_status("running")
+        await self._save(job)
+        try:
+            job.result = await job._run()
+            status = "done"
+        except HTTPException as e:
+            # Same outcome the synchronous endpoint would have answered with
+            job.error = {"status_code": e.status_code, "detail": e.detail}
+            status = "failed"
+        except Exception as e:
+            print(f"⚠️ Verification job {job.id} ({job.kind}) crashed: {e.__class__.__name__}: {e}")
+            job.error = {"status_code": 500, "detail": "Verification failed unexpectedly. Please try again."}
+            status = "failed"
+        finally:
+            self._running -= 1
+            self._release(job)
+
+        job.finished_at = time.time()
+        self._run_ms.append((job.finished_at - job.started_at) * 1000)
+        if status == "done":
+            self.completed += 1
+        else:
+            self.failed += 1
+        job._set_status(status)
+        await self._save(job)
+
+    def _release(self, job: Job):
+        job._run = None # drop the closure (and the upload bytes it holds)
+        if job._cleanup is not None:
+            try:
+                job._cleanup()
+            except OSError as e:
+                print(f"⚠️ Could not clean up upload for job {job.id}: {e}")
+            job._cleanup = None
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl_seconds
+        expired = [job_id for job_id, job in self.jobs.items() if job.finished and job.finished_at < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def stats(self) -> dict:
+        def average(values):
+            return round(sum(values) / len(values), 1) if values else None
+
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "running": self._running,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "stored": len(self.jobs),
+            "db_writes": self.db_writes,
+            "wait_ms_avg": average(self._wait_ms),
+            "run_ms_avg": average(self._run_ms),
+        }
+
+    async def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+        # Jobs that never ran still own their spooled uploads
+        for job in self.jobs.values():
+            if not job.finished:
+                self._release(job)
+
+
+queue = JobQueue(VERIFICATION_WORKERS, VERIFICATION_MAX_PENDING, VERIFICATION_JOB_TTL_SECONDS)
@@ -34,7 +34,7 @@ const ScannerModal = ({ isOpen, onClose }) => {
             setResult(data);
             fetchUser(); // Refresh coins
         } catch (err) {
-            setError(err.message || "Failed to analyze object. Please try again.");
+            setError(err.response?.data?.detail || err.message || "Failed to analyze object. Please try again.");
         } finally {
             setLoading(false);
         }
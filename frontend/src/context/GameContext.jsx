@@ -61,9 +61,8 @@ export const GameProvider = ({ children }) => {
     // Initial Load - Check Token
     useEffect(() => {
         const init = async () => {
-            await fetchUser();
-            // Always fetch levels (Public Data)
-            await fetchLevels();
+            // User and level map are independent, so fetch them in parallel
+            await Promise.all([fetchUser(), fetchLevels()]);
             setLoading(false);
         };
         init();
@@ -71,12 +70,14 @@ export const GameProvider = ({ children }) => {
 
     const fetchLevels = async () => {
         try {
-            const res = await api.get('/levels');
-            // We need to merge backend levels with local progress if needed, 
-            // but for now backend is the source of truth for level content.
-            // Backend should also return status, or we map user.progress to levels.
-            // My API currently returns just levels. The user object has 'progress'.
-            // I need to map them.
+            // Logged in: /levels/me returns the level map already merged with this user's
+            // status and score. Logged out: plain level content (Public Data).
+            const token = localStorage.getItem('token');
+            const res = await api.get(token ? '/levels/me' : '/levels').catch((err) => {
+                // Expired token: still show the public map
+                if (token && err.response?.status === 401) return api.get('/levels');
+                throw err;
+            });
             setLevels(res.data);
         } catch (err) {
             console.error("Fetch Levels Failed. Current BaseURL:", api.defaults.baseURL, err);
@@ -201,6 +202,10 @@ export const GameProvider = ({ children }) => {
 
     // Helper: Get Level Status from User Progress
     const getLevelStatus = (levelId) => {
+        // Prefer the status merged by /levels/me
+        const level = levels.find(l => l.id === levelId);
+        if (level && level.status) return level.status;
+
         if (!user || !user.progress) {
             // Fallback for immediate UI if user data takes a split second
             // But actually, just default to locked if not found, unless it's Level 1
@@ -27,9 +27,13 @@ export const authAPI = {
 
 export const gameAPI = {
     getLevels: () => api.get('/levels'),
+    getMyLevelMap: () => api.get('/levels/me'),
     updateProgress: (levelId, coinsEarned, xpEarned) =>
         api.post('/users/progress', { level_id: levelId, coins_earned: coinsEarned, xp_earned: xpEarned }),
 
+    // Replays queued offline progress in one request; each event needs a unique event_id
+    updateProgressBatch: (events) => api.post('/users/progress/batch', { events }),
+
     // Uses the newly added chat endpoint in main.py
     chat: (message) => api.post('/chat', { message }),
 
@@ -60,7 +64,27 @@ export const gameAPI = {
     getStoreItems: () => api.get('/store/items'),
     buyStoreItem: (itemId) => api.post('/store/buy', { item_id: itemId }),
 
-    getLeaderboard: () => api.get('/leaderboard'),
+    getLeaderboard: (limit = 10, offset = 0) => api.get('/leaderboard', { params: { limit, offset } }),
+    getMyRank: () => api.get('/leaderboard/me'),
+
+    // Catalog rows changed after `since` (0 = everything) plus deleted ids; keep the returned version
+    syncCatalog: (since = 0) => api.get('/sync', { params: { since } }),
+
+    // Async verification: post to /verify-task, /eco-scanner or /challenges/{id}/complete with
+    // `?async=true` to get { job_id } back (HTTP 202), then read the outcome here
+    getJob: (jobId) => api.get(`/jobs/${jobId}`),
+    waitForJob: async (jobId, intervalMs = 1500) => {
+        for (;;) {
+            const { data } = await api.get(`/jobs/${jobId}`);
+            if (data.status === 'done') return data.result;
+            if (data.status === 'failed') {
+                const error = new Error(data.error?.detail || 'Verification failed');
+                error.status = data.error?.status_code;
+                throw error;
+            }
+            await new Promise((resolve) => setTimeout(resolve, intervalMs));
+        }
+    },
 };
 
 export default api;
\ No newline at end of file
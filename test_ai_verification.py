@@ -1,8 +1,12 @@
 
 import asyncio
 import os
+import sys
 from dotenv import load_dotenv
-from backend import ai_service
+
+# backend modules import each other by flat name (e.g. model_router)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import ai_service
 
 # Load env for API key
 load_dotenv()
@@ -1,28 +1,36 @@
+import os
+import sys
 
-import sqlite3
+# Writes go through the backend's ORM session so catalog_sync stamps a new version on
+# the changed challenges and /sync delta clients pick the new rewards up.
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(BACKEND_DIR, 'ecoloop.db')}")
+sys.path.insert(0, BACKEND_DIR)
+
+import database
+import models
+import catalog_sync # registers the before_flush version hook
 
 def update_challenges():
-    conn = sqlite3.connect('backend/ecoloop.db')
-    cursor = conn.cursor()
+    db = database.SessionLocal()
     try:
-        # Update daily challenges (reward 50 -> 20)
-        cursor.execute("UPDATE challenges SET coin_reward = 20 WHERE type = 'daily'")
-        
-        # Update weekly challenges (reward > 20 -> 20)
-        cursor.execute("UPDATE challenges SET coin_reward = 20 WHERE type = 'weekly'")
-        
-        conn.commit()
-        print("Challenges updated to 20 coins.")
-        
+        # Daily and weekly challenges both pay 20 coins
+        challenges = db.query(models.Challenge).filter(models.Challenge.type.in_(['daily', 'weekly'])).all()
+        for challenge in challenges:
+            challenge.coin_reward = 20
+
+        db.commit()
+        print(f"Challenges updated to 20 coins (catalog version {catalog_sync.current_version(db)}).")
+
         # Verify
-        cursor.execute("SELECT title, coin_reward, type FROM challenges")
-        for row in cursor.fetchall():
-            print(f"{row[0]} ({row[2]}): {row[1]}")
-            
+        for challenge in db.query(models.Challenge).all():
+            print(f"{challenge.title} ({challenge.type}): {challenge.coin_reward} [v{challenge.version}]")
+
     except Exception as e:
+        db.rollback()
         print(f"Error updating DB: {e}")
     finally:
-        conn.close()
+        db.close()
 
 if __name__ == "__main__":
     update_challenges()